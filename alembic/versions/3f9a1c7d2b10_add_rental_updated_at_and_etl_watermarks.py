@@ -0,0 +1,38 @@
+"""Add rentals.updated_at and etl_watermarks for incremental ETL
+
+Revision ID: 3f9a1c7d2b10
+Revises: de1d25a2796c
+Create Date: 2026-10-18 09:12:04.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c7d2b10'
+down_revision = 'de1d25a2796c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Track when a rental was last changed so the ETL can pick up only new or changed rows
+    op.add_column('rentals', sa.Column('updated_at', sa.DateTime, nullable=True))
+    op.execute("UPDATE rentals SET updated_at = created_at")
+    op.create_index('ix_rentals_updated_at', 'rentals', ['updated_at'])
+
+    # Persisted high-water marks, one row per job
+    op.create_table(
+        'etl_watermarks',
+        sa.Column('job_name', sa.String, primary_key=True),
+        sa.Column('high_water_mark', sa.DateTime, nullable=True),
+        sa.Column('updated_at', sa.DateTime, nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('etl_watermarks')
+    op.drop_index('ix_rentals_updated_at', table_name='rentals')
+    op.drop_column('rentals', 'updated_at')
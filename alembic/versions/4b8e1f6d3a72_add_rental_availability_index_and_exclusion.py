@@ -0,0 +1,50 @@
+"""Add rental availability index and no-overlap exclusion constraint
+
+Revision ID: 4b8e1f6d3a72
+Revises: e7b4d2a9c581
+Create Date: 2026-10-18 18:12:40.227931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e1f6d3a72'
+down_revision = 'e7b4d2a9c581'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE_BOOKING = "rental_status NOT IN ('Cancelled', 'Completed')"
+
+
+def upgrade():
+    op.create_index('ix_rentals_vehicle_period', 'rentals', ['vehicle_id', 'pickup_date', 'return_date'])
+
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # The constraint cannot be added while live bookings overlap; refuse with a count rather than guess which to cancel
+    overlaps = op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM rentals a JOIN rentals b ON a.vehicle_id = b.vehicle_id AND a.rental_id < b.rental_id "
+        "AND a.pickup_date <= b.return_date AND b.pickup_date <= a.return_date "
+        f"WHERE a.{LIVE_BOOKING} AND b.{LIVE_BOOKING}"
+    )).scalar()
+    if overlaps:
+        raise RuntimeError(
+            f"{overlaps} pairs of live rentals double-book a vehicle; cancel or complete one of each pair, then upgrade again"
+        )
+
+    # int4range(vehicle_id, vehicle_id) stands in for btree_gist's integer equality
+    op.execute(
+        "ALTER TABLE rentals ADD CONSTRAINT ex_rentals_vehicle_period EXCLUDE USING gist "
+        "(int4range(vehicle_id, vehicle_id, '[]') WITH &&, tsrange(pickup_date, return_date, '[]') WITH &&) "
+        f"WHERE ({LIVE_BOOKING})"
+    )
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE rentals DROP CONSTRAINT ex_rentals_vehicle_period")
+    op.drop_index('ix_rentals_vehicle_period', table_name='rentals')
@@ -0,0 +1,30 @@
+"""Make rental_summary.rental_id unique for bulk upserts
+
+Revision ID: 8c2e5d41a9f3
+Revises: 3f9a1c7d2b10
+Create Date: 2026-10-18 10:02:37.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e5d41a9f3'
+down_revision = '3f9a1c7d2b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Keep only the newest summary per rental before enforcing uniqueness
+    op.execute(
+        "DELETE FROM rental_summary WHERE summary_id NOT IN "
+        "(SELECT MAX(summary_id) FROM rental_summary GROUP BY rental_id)"
+    )
+    op.create_unique_constraint('uq_rental_summary_rental_id', 'rental_summary', ['rental_id'])
+
+def downgrade():
+    op.drop_constraint('uq_rental_summary_rental_id', 'rental_summary', type_='unique')
@@ -0,0 +1,30 @@
+"""Index vehicles by location and rentals by return date for availability search
+
+Revision ID: 9d6f2c4b8e13
+Revises: 4b8e1f6d3a72
+Create Date: 2026-10-18 19:02:51.603117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d6f2c4b8e13'
+down_revision = '4b8e1f6d3a72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Searches match city and state case-insensitively
+    op.create_index('ix_vehicles_location', 'vehicles', [sa.text('lower(location_state)'), sa.text('lower(location_city)')])
+
+    # Lets wide searches collect the rentals overlapping the dates instead of probing every vehicle
+    op.create_index('ix_rentals_return_period', 'rentals', ['return_date', 'pickup_date'])
+
+def downgrade():
+    op.drop_index('ix_rentals_return_period', table_name='rentals')
+    op.drop_index('ix_vehicles_location', table_name='vehicles')
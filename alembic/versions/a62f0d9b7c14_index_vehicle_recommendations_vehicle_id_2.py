@@ -0,0 +1,26 @@
+"""Index vehicle_recommendations.vehicle_id_2 for lookups from either side of a pair
+
+Revision ID: a62f0d9b7c14
+Revises: f1c3a8e5b902
+Create Date: 2026-10-18 15:02:18.316904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a62f0d9b7c14'
+down_revision = 'f1c3a8e5b902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # vehicle_id_1 lookups use the unique (vehicle_id_1, vehicle_id_2) index
+    op.create_index('ix_vehicle_recommendations_vehicle_id_2', 'vehicle_recommendations', ['vehicle_id_2'])
+
+def downgrade():
+    op.drop_index('ix_vehicle_recommendations_vehicle_id_2', table_name='vehicle_recommendations')
@@ -0,0 +1,42 @@
+"""Add etl_runs ledger
+
+Revision ID: b47d0e92c615
+Revises: 8c2e5d41a9f3
+Create Date: 2026-10-18 11:20:51.304877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b47d0e92c615'
+down_revision = '8c2e5d41a9f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # One row per ETL run, read by the status pages instead of scanning rental_summary
+    op.create_table(
+        'etl_runs',
+        sa.Column('run_id', sa.Integer, primary_key=True, index=True),
+        sa.Column('mode', sa.String, nullable=False),
+        sa.Column('status', sa.String, nullable=False),
+        sa.Column('started_at', sa.DateTime, nullable=False),
+        sa.Column('finished_at', sa.DateTime, nullable=True),
+        sa.Column('rows_extracted', sa.Integer, nullable=False),
+        sa.Column('rows_inserted', sa.Integer, nullable=False),
+        sa.Column('rows_updated', sa.Integer, nullable=False),
+        sa.Column('rows_skipped', sa.Integer, nullable=False),
+        sa.Column('extract_seconds', sa.Float, nullable=True),
+        sa.Column('transform_seconds', sa.Float, nullable=True),
+        sa.Column('load_seconds', sa.Float, nullable=True),
+        sa.Column('summary_rows', sa.Integer, nullable=True),
+        sa.Column('error', sa.Text, nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('etl_runs')
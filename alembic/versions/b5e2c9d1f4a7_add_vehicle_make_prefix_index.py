@@ -0,0 +1,30 @@
+"""Index vehicles by lowercased make for catalog prefix search
+
+Revision ID: b5e2c9d1f4a7
+Revises: 9d6f2c4b8e13
+Create Date: 2026-10-18 21:40:12.384561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e2c9d1f4a7'
+down_revision = '9d6f2c4b8e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # The catalog matches the start of the make case-insensitively: lower(make) LIKE 'prefix%'.
+    # The pattern operator class lets PostgreSQL use the index for it under any collation
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute("CREATE INDEX ix_vehicles_make ON vehicles (lower(make) text_pattern_ops)")
+    else:
+        op.create_index('ix_vehicles_make', 'vehicles', [sa.text('lower(make)')])
+
+def downgrade():
+    op.drop_index('ix_vehicles_make', table_name='vehicles')
@@ -0,0 +1,31 @@
+"""Add user_recommendations per-user top-N cache
+
+Revision ID: c3e9b1f47a20
+Revises: a62f0d9b7c14
+Create Date: 2026-10-18 15:48:27.530196
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e9b1f47a20'
+down_revision = 'a62f0d9b7c14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Filled after each recommendation run; a user's row is dropped when they rent
+    op.create_table(
+        'user_recommendations',
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.user_id'), primary_key=True, autoincrement=False),
+        sa.Column('vehicle_ids', sa.JSON, nullable=False),
+        sa.Column('computed_at', sa.DateTime, nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('user_recommendations')
@@ -0,0 +1,26 @@
+"""Add rows_total to etl_runs so every process can show a running run's progress
+
+Revision ID: c8f4e2a7d913
+Revises: b5e2c9d1f4a7
+Create Date: 2026-10-19 09:12:51.604277
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f4e2a7d913'
+down_revision = 'b5e2c9d1f4a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Rentals in the run's window; rows_extracted is updated as chunks commit
+    op.add_column('etl_runs', sa.Column('rows_total', sa.Integer, nullable=True))
+
+def downgrade():
+    op.drop_column('etl_runs', 'rows_total')
@@ -0,0 +1,43 @@
+"""Add etl_checkpoints and run windows for resumable ETL runs
+
+Revision ID: d5a83f6c0e27
+Revises: b47d0e92c615
+Create Date: 2026-10-18 12:41:09.872214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a83f6c0e27'
+down_revision = 'b47d0e92c615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Change window of each run, so a resumed run processes exactly the same rentals
+    op.add_column('etl_runs', sa.Column('window_start', sa.DateTime, nullable=True))
+    op.add_column('etl_runs', sa.Column('window_end', sa.DateTime, nullable=True))
+    op.add_column('etl_runs', sa.Column('resumed_from', sa.Integer, sa.ForeignKey('etl_runs.run_id'), nullable=True))
+
+    # Last committed rental_id per partition of a run
+    op.create_table(
+        'etl_checkpoints',
+        sa.Column('checkpoint_id', sa.Integer, primary_key=True, index=True),
+        sa.Column('run_id', sa.Integer, sa.ForeignKey('etl_runs.run_id'), nullable=False, index=True),
+        sa.Column('start_key', sa.Integer, nullable=True),
+        sa.Column('end_key', sa.Integer, nullable=True),
+        sa.Column('checkpoint_key', sa.Integer, nullable=True),
+        sa.Column('status', sa.String, nullable=False),
+        sa.Column('error', sa.Text, nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('etl_checkpoints')
+    op.drop_column('etl_runs', 'resumed_from')
+    op.drop_column('etl_runs', 'window_end')
+    op.drop_column('etl_runs', 'window_start')
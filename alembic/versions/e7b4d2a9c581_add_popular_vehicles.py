@@ -0,0 +1,32 @@
+"""Add popular_vehicles cold-start recommendations
+
+Revision ID: e7b4d2a9c581
+Revises: c3e9b1f47a20
+Create Date: 2026-10-18 17:05:12.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b4d2a9c581'
+down_revision = 'c3e9b1f47a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Most rented vehicles per normalized city/state ('' for state-wide and fleet-wide lists), filled by each recommendation run
+    op.create_table(
+        'popular_vehicles',
+        sa.Column('location_state', sa.String, primary_key=True),
+        sa.Column('location_city', sa.String, primary_key=True),
+        sa.Column('vehicle_ids', sa.JSON, nullable=False),
+        sa.Column('computed_at', sa.DateTime, nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('popular_vehicles')
@@ -0,0 +1,50 @@
+"""Add incremental recommendation state and unique vehicle_recommendations pairs
+
+Revision ID: f1c3a8e5b902
+Revises: d5a83f6c0e27
+Create Date: 2026-10-18 14:31:52.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3a8e5b902'
+down_revision = 'd5a83f6c0e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Keep only the newest row per pair before enforcing uniqueness (the upsert key for count increments)
+    op.execute(
+        "DELETE FROM vehicle_recommendations WHERE recommendation_id NOT IN "
+        "(SELECT MAX(recommendation_id) FROM vehicle_recommendations GROUP BY vehicle_id_1, vehicle_id_2)"
+    )
+    op.create_unique_constraint('uq_vehicle_recommendations_pair', 'vehicle_recommendations', ['vehicle_id_1', 'vehicle_id_2'])
+
+    # Rentals currently counted in vehicle_recommendations; empty until the next full run
+    op.create_table(
+        'recommendation_rentals',
+        sa.Column('rental_id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('user_id', sa.Integer, nullable=False),
+        sa.Column('vehicle_id', sa.Integer, nullable=False)
+    )
+    op.create_index('ix_recommendation_rentals_user_id', 'recommendation_rentals', ['user_id'])
+
+    # Rentals deleted since the last recommendation run
+    op.create_table(
+        'rental_deletions',
+        sa.Column('deletion_id', sa.Integer, primary_key=True),
+        sa.Column('rental_id', sa.Integer, nullable=False),
+        sa.Column('deleted_at', sa.DateTime, nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('rental_deletions')
+    op.drop_index('ix_recommendation_rentals_user_id', table_name='recommendation_rentals')
+    op.drop_table('recommendation_rentals')
+    op.drop_constraint('uq_vehicle_recommendations_pair', 'vehicle_recommendations', type_='unique')
@@ -2,18 +2,40 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from database import Base, engine, SessionLocal, init_db, User, Vehicle, Rental, RentalSummary, VehicleRecommendations
+import time
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g
+from database import db_session, pool_stats, init_db, User, Vehicle, Rental
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from etl_process import run_etl
+from auth import password_hasher, AuthBusyError
+from request_metrics import route_latency
+from etl_jobs import etl_runner
+from etl_process import latest_run, recent_runs
+from recommendation_index import recommendation_server, user_recommendations, invalidate_user_recommendations
+from availability import book_vehicle, available_vehicles, VehicleUnavailableError, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
+from catalog import vehicle_catalog, CATALOG_PAGE_SIZE, CATALOG_MAX_PAGE_SIZE
+from geo_index import geo_server, NEARBY_PAGE_SIZE, NEARBY_MAX_PAGE_SIZE
 
 app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # For flash messages
+app.secret_key = os.getenv('SECRET_KEY', 'your_secret_key')  # For flash messages; must be the same in every worker
 app.config['SESSION_TYPE'] = 'filesystem'  # To store session data on the filesystem
 
-# Create all tables
-Base.metadata.create_all(engine)
+# Every request shares one session (db_session) and hands it back to the pool when it ends, even on errors
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    db_session.remove()
+
+# Routes that hash or verify passwords; their latency is reported apart from the rest
+AUTH_ENDPOINTS = {'register', 'login'}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.teardown_request
+def record_request_latency(exception=None):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route_latency.record('auth' if request.endpoint in AUTH_ENDPOINTS else 'other', time.perf_counter() - started)
 
 # Initialize database tables
 def init_database():
@@ -32,7 +54,7 @@ def index():
 # Registration Route
 @app.route('/register', methods=['GET', 'POST'])
 def register():
-    session_db = SessionLocal()
+    session_db = db_session()
     if request.method == 'POST':
         first_name = request.form['first_name']
         last_name = request.form['last_name']
@@ -52,15 +74,20 @@ def register():
         existing_user = session_db.query(User).filter_by(username=username).first()
         if existing_user:
             flash("Username already exists. Please log in instead.")
-            session_db.close()
             return redirect(url_for('login'))
 
+        # Hash the password on the worker pool (slow by design)
+        try:
+            password_hash = password_hasher.hash(password)
+        except AuthBusyError as e:
+            return str(e), 503
+
         # Create and add new user
         new_user = User(
             first_name=first_name,
             last_name=last_name,
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=password_hash,
             email=email,
             phone_number=phone_number,
             age=age,
@@ -73,7 +100,6 @@ def register():
         
         session_db.add(new_user)
         session_db.commit()
-        session_db.close()
         
         flash("Registration successful! Please log in.")
         return redirect(url_for('login'))
@@ -83,7 +109,7 @@ def register():
 # Login Route
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    session_db = SessionLocal()
+    session_db = db_session()
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
@@ -92,18 +118,31 @@ def login():
         user = session_db.query(User).filter_by(username=username).first()
         
         if user:
-            if user.check_password(password):
+            try:
+                password_ok = password_hasher.verify(user.password_hash, password)
+            except AuthBusyError as e:
+                return str(e), 503
+
+            if password_ok:
+                # Upgrade hashes made with older parameters (AUTH_HASH_METHOD) while the password is at hand
+                try:
+                    if password_hasher.needs_rehash(user.password_hash):
+                        user.password_hash = password_hasher.hash(password)
+                        session_db.commit()
+                except AuthBusyError:
+                    pass  # Keep the old hash; a later login upgrades it
                 # Set session with user_id
                 session['user_id'] = user.user_id
+                # Kept for cold-start recommendations, so the rent page doesn't have to look the user up
+                session['state'] = user.state
+                session['city'] = user.city
                 flash("Login successful!")
-                session_db.close()
                 return redirect(url_for('rent_vehicle'))
             else:
                 flash("Incorrect password. Please try again.")
         else:
             flash("Username does not exist. Please check or register.")
 
-        session_db.close()
         return redirect(url_for('login'))
 
     return render_template('login.html')
@@ -111,16 +150,15 @@ def login():
 # Add User Route
 @app.route('/add_user', methods=['GET', 'POST'])
 def add_user():
-    session = SessionLocal()
+    session_db = db_session()
     if request.method == 'POST':
         name = request.form['name']
         age = request.form['age']
         license_number = request.form['license_number']
         
         new_user = User(name=name, age=int(age), license_number=license_number)
-        session.add(new_user)
-        session.commit()
-        session.close()
+        session_db.add(new_user)
+        session_db.commit()
         return redirect(url_for('user_added'))
 
     return render_template('add_user.html')
@@ -137,7 +175,7 @@ def rent_vehicle():
         flash("Please log in to rent a vehicle.")
         return redirect(url_for('login'))
     
-    session_db = SessionLocal()
+    session_db = db_session()
     user_id = session['user_id']
     
     if request.method == 'POST':
@@ -153,23 +191,11 @@ def rent_vehicle():
         # Validate vehicle_id
         vehicle = session_db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
         if not vehicle_id:
-            session_db.close()
             return "Vehicle selection is required.", 400
         
         # Convert vehicle_id to integer if not empty
         vehicle_id = int(vehicle_id)
         
-        # Check if the vehicle is available for the specified dates
-        overlapping_rentals = session_db.query(Rental).filter(
-            Rental.vehicle_id == vehicle_id,
-            Rental.return_date >= start_date,
-            Rental.pickup_date <= end_date
-        ).all()
-
-        if overlapping_rentals:
-            session_db.close()
-            return "Vehicle is already rented for the selected dates."
-
         # Use vehicle location as pickup/return location
         pickup_location = f"{vehicle.location_city}, {vehicle.location_state}"
         return_location = pickup_location  # Assume same location for now
@@ -177,7 +203,6 @@ def rent_vehicle():
         # Calculate rental days and cost
         rental_days = (end_date - start_date).days
         if rental_days <= 0:
-            session_db.close()
             return "Invalid rental duration. End date must be after start date.", 400
             
         total_cost = rental_days * float(vehicle.daily_rate)
@@ -194,37 +219,118 @@ def rent_vehicle():
             rental_status="Ongoing"
         )
         
-        session_db.add(rental)
+        # Book it only if the vehicle is free for the dates (checked under a lock, so concurrent requests can't double-book)
+        try:
+            book_vehicle(session_db, rental)
+        except VehicleUnavailableError:
+            return "Vehicle is already rented for the selected dates.", 409
+
+        invalidate_user_recommendations(session_db, customer_id)
         session_db.commit()
 
         # Redirect to the confirmation page with the rental ID
         rental_id = rental.rental_id
-        session_db.close()
         return redirect(url_for('rental_confirmation', rental_id=rental_id))
 
-    # Fetch all vehicles for the dropdown in GET request
-    vehicles = session_db.query(Vehicle).all()
-
-    # Fetch recommendations
-    recommended_vehicles = get_recommended_vehicles(user_id)
-
-    session_db.close()
-    return render_template('rent_vehicle.html', vehicles=vehicles, recommended_vehicles=recommended_vehicles)
+    # Fetch recommendations (the vehicle picker loads its options from /vehicles as the user filters)
+    recommended_vehicles = get_recommended_vehicles(user_id, state=session.get('state'), city=session.get('city'))
+
+    return render_template('rent_vehicle.html', recommended_vehicles=recommended_vehicles)
+
+def vehicle_to_dict(vehicle):
+    return {
+        "vehicle_id": vehicle.vehicle_id,
+        "make": vehicle.make,
+        "model": vehicle.model,
+        "year": vehicle.year,
+        "type": vehicle.type,
+        "daily_rate": float(vehicle.daily_rate),
+        "location_city": vehicle.location_city,
+        "location_state": vehicle.location_state
+    }
+
+# Vehicle Catalog Route (JSON): one filtered page of vehicles, for the rent form's vehicle picker
+@app.route('/vehicles')
+def list_vehicles():
+    limit = min(request.args.get('limit', CATALOG_PAGE_SIZE, type=int), CATALOG_MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify(error="limit must be at least 1."), 400
+
+    vehicles, next_after = vehicle_catalog(
+        db_session(),
+        make=request.args.get('make'),
+        vehicle_type=request.args.get('type'),
+        state=request.args.get('state'),
+        min_daily_rate=request.args.get('min_daily_rate', type=float),
+        max_daily_rate=request.args.get('max_daily_rate', type=float),
+        after=request.args.get('after', type=int),
+        limit=limit
+    )
+    return jsonify(vehicles=[vehicle_to_dict(vehicle) for vehicle in vehicles], next_after=next_after)
+
+# Nearby Vehicles Route (JSON): the k vehicles closest to a point, optionally within a radius
+@app.route('/vehicles/nearby')
+def nearby_vehicles():
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', type=float)
+    k = min(request.args.get('k', NEARBY_PAGE_SIZE, type=int), NEARBY_MAX_PAGE_SIZE)
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify(error="lat and lon are required, in degrees."), 400
+    if k < 1 or (radius_km is not None and radius_km < 0):
+        return jsonify(error="k must be at least 1 and radius_km not negative."), 400
+
+    matches = geo_server.nearest(latitude, longitude, k=k, radius_km=radius_km)
+    if not matches:
+        return jsonify(vehicles=[])
+
+    vehicles = {
+        vehicle.vehicle_id: vehicle
+        for vehicle in db_session().query(Vehicle).filter(Vehicle.vehicle_id.in_([vehicle_id for vehicle_id, _ in matches]))
+    }
+    return jsonify(vehicles=[
+        dict(vehicle_to_dict(vehicles[vehicle_id]), distance_km=round(distance_km, 3))
+        for vehicle_id, distance_km in matches if vehicle_id in vehicles
+    ])
+
+# Availability Search Route (JSON): vehicles free for the whole date range, one page at a time
+@app.route('/vehicles/available')
+def search_available_vehicles():
+    try:
+        start_date = datetime.strptime(request.args['start_date'], "%Y-%m-%d")
+        end_date = datetime.strptime(request.args['end_date'], "%Y-%m-%d")
+        max_daily_rate = request.args.get('max_daily_rate', type=float)
+        after = request.args.get('after', type=int)
+        limit = min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), SEARCH_MAX_PAGE_SIZE)
+    except (KeyError, ValueError):
+        return jsonify(error="start_date and end_date (YYYY-MM-DD) are required."), 400
+    if end_date <= start_date or limit < 1:
+        return jsonify(error="End date must be after start date, and limit at least 1."), 400
+
+    vehicles, next_after = available_vehicles(
+        db_session(), start_date, end_date,
+        city=request.args.get('city'),
+        state=request.args.get('state'),
+        vehicle_type=request.args.get('type'),
+        max_daily_rate=max_daily_rate,
+        after=after,
+        limit=limit
+    )
+    return jsonify(vehicles=[vehicle_to_dict(vehicle) for vehicle in vehicles], next_after=next_after)
 
 # Rental Confirmation Route
 @app.route('/rental_confirmation/<int:rental_id>')
 def rental_confirmation(rental_id):
-    session = SessionLocal()
+    session_db = db_session()
     
     # Retrieve the rental
-    rental = session.query(Rental).filter(Rental.rental_id == rental_id).first()
+    rental = session_db.query(Rental).filter(Rental.rental_id == rental_id).first()
     if not rental:
-        session.close()
         return "Rental not found!"
     
     # Retrieve the associated user and vehicle
-    user = session.query(User).filter(User.user_id == rental.user_id).first()
-    vehicle = session.query(Vehicle).filter(Vehicle.vehicle_id == rental.vehicle_id).first()
+    user = session_db.query(User).filter(User.user_id == rental.user_id).first()
+    vehicle = session_db.query(Vehicle).filter(Vehicle.vehicle_id == rental.vehicle_id).first()
 
     # Calculate the total cost
     pickup_date = rental.pickup_date
@@ -232,8 +338,6 @@ def rental_confirmation(rental_id):
     rental_days = (return_date - pickup_date).days
     total_cost = rental_days * vehicle.daily_rate if rental_days > 0 else vehicle.daily_rate
     
-    session.close()
-    
     return render_template(
         'rental_confirmation.html', 
         rental=rental, 
@@ -247,67 +351,92 @@ def rental_confirmation(rental_id):
 def logout():
     # Clear the user session
     session.pop('user_id', None)
+    session.pop('state', None)
+    session.pop('city', None)
     flash("You have been logged out.")
     return redirect(url_for('index'))
 
 @app.route('/etl_status', methods=['GET', 'POST'])
 def etl_status():
-    session = SessionLocal()
+    session_db = db_session()
     last_updated = None
     total_records = 0
+    runs = []
 
     if request.method == 'POST':
-        # Trigger the ETL process manually
-        try:
-            run_etl()
-            flash("ETL process completed successfully!", "success")
-        except Exception as e:
-            flash(f"Error running ETL process: {e}", "error")
+        # Queue the ETL process on the background runner and return right away
+        if etl_runner.submit(full_refresh=bool(request.form.get('full_refresh')), resume=bool(request.form.get('resume'))):
+            flash("ETL process queued.", "success")
+        else:
+            flash("An ETL run is already in progress; your request was merged into it.", "info")
+        return redirect(url_for('etl_status'))
 
     try:
-        # Fetch the last update timestamp and record count
-        summary_records = session.query(RentalSummary).all()
-        total_records = len(summary_records)
-        if total_records > 0:
-            last_updated = max(record.last_updated for record in summary_records)
+        # Fetch the last update timestamp and record count from the run ledger
+        last_run = latest_run(session_db, status="succeeded")
+        if last_run:
+            total_records = last_run.summary_rows or 0
+            last_updated = last_run.finished_at
+        runs = recent_runs(session_db)
     except Exception as e:
+        session_db.rollback()
         flash(f"Error fetching ETL status: {e}", "error")
-    finally:
-        session.close()
 
     return render_template(
         'etl_status.html',
         total_records=total_records,
-        last_updated=last_updated
+        last_updated=last_updated,
+        runs=runs,
+        job=etl_runner.status()
     )
 
-from sqlalchemy.orm import joinedload
+# Connection pool usage, for sizing DB_POOL_SIZE / DB_MAX_OVERFLOW per worker
+@app.route('/pool_stats')
+def connection_pool_stats():
+    return jsonify(pool_stats())
+
+# Request latency of this worker, auth routes apart from the rest, and the password hashing pool's load
+@app.route('/latency_stats')
+def latency_stats():
+    return jsonify(routes=route_latency.snapshot(), password_hashing=password_hasher.stats())
 
-def get_recommended_vehicles(user_id):
-    session = SessionLocal()
+def get_recommended_vehicles(user_id, state=None, city=None):
+    session_db = db_session()
     try:
-        # Fetch the user's rental history
-        user_rentals = session.query(Rental).filter(Rental.user_id == user_id).all()
-        rented_vehicle_ids = {rental.vehicle_id for rental in user_rentals}
-
-        # Fetch recommendations based on rented vehicles
-        recommendations = session.query(VehicleRecommendations).filter(
-            VehicleRecommendations.vehicle_id_1.in_(rented_vehicle_ids)
-        ).order_by(VehicleRecommendations.recommendation_score.desc()).limit(5).all()
-
-        # Fetch the recommended vehicle details
-        recommended_vehicle_ids = {rec.vehicle_id_2 for rec in recommendations}
-        recommended_vehicles = session.query(Vehicle).filter(
-            Vehicle.vehicle_id.in_(recommended_vehicle_ids)
-        ).all()
-
-        return recommended_vehicles
+        # Fetch the user's cached recommendations (ranked from the serving index on a miss,
+        # the most rented vehicles near them if they have no rentals yet)
+        recommended_vehicle_ids = user_recommendations(session_db, user_id, n=5, state=state, city=city)
+        if not recommended_vehicle_ids:
+            return []
+
+        # Fetch the recommended vehicle details, best first
+        vehicles = {
+            vehicle.vehicle_id: vehicle
+            for vehicle in session_db.query(Vehicle).filter(Vehicle.vehicle_id.in_(recommended_vehicle_ids))
+        }
+        return [vehicles[vehicle_id] for vehicle_id in recommended_vehicle_ids if vehicle_id in vehicles]
     except Exception as e:
+        session_db.rollback()
         print(f"Error fetching recommendations: {e}")
         return []
-    finally:
-        session.close()
+
+
+def create_app():
+    """
+    Returns the app ready to serve: the entry point for WSGI servers (wsgi.py) and the
+    dev server. Loads the recommendation serving index up front so the first
+    /rent_vehicle doesn't pay for it; with a preloading server that happens once,
+    before the workers are forked.
+    """
+    try:
+        recommendation_server.current()
+    except Exception as e:
+        print(f"Recommendation index not loaded at startup: {e}")
+    return app
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
+    # Development server only; production runs wsgi:app under gunicorn (gunicorn.conf.py)
+    # Schema is managed by Alembic; this only fills in missing tables for local runs
+    init_db()
+    create_app().run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# werkzeug hash method for new and upgraded hashes, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+# Changing it rehashes each user's password the next time they log in
+AUTH_HASH_METHOD = os.getenv("AUTH_HASH_METHOD", "scrypt")
+AUTH_SALT_LENGTH = int(os.getenv("AUTH_SALT_LENGTH", "16"))
+# Worker processes that run the hashing, per web process
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "2"))
+# Scheduling priority the hashing processes give up (0-19), so booking traffic wins the CPU when both need it
+AUTH_WORKER_NICE = int(os.getenv("AUTH_WORKER_NICE", "5"))
+# Hashes admitted at once; further requests wait up to AUTH_QUEUE_TIMEOUT seconds for a slot. The default,
+# one per worker process, means an admitted hash starts at once instead of queueing in the pool past the timeout
+AUTH_CONCURRENCY = int(os.getenv("AUTH_CONCURRENCY", str(AUTH_WORKERS)))
+AUTH_QUEUE_TIMEOUT = float(os.getenv("AUTH_QUEUE_TIMEOUT", "5"))
+
+
+def timed_call(function, *args):
+    """
+    Runs function on a pool worker and returns (result, seconds it ran there).
+    """
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+class AuthBusyError(Exception):
+    """
+    Raised when no hashing slot frees up within AUTH_QUEUE_TIMEOUT seconds.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification (deliberately slow key derivation) on a
+    pool of worker processes, so a burst of logins cannot take the request threads'
+    CPU from other traffic. A semaphore caps the work running or queued at once;
+    callers beyond it wait for a slot, and give up with AuthBusyError after the
+    queue timeout instead of piling up.
+    """
+
+    def __init__(self, method=AUTH_HASH_METHOD, salt_length=AUTH_SALT_LENGTH, workers=AUTH_WORKERS,
+                 concurrency=AUTH_CONCURRENCY, queue_timeout=AUTH_QUEUE_TIMEOUT):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._method_prefix = None
+        self._stats = {"hashed": 0, "verified": 0, "rejected": 0, "in_flight": 0, "queue_wait": 0.0, "max_queue_wait": 0.0, "work": 0.0, "max_work": 0.0}
+
+    def _executor(self):
+        # Created on first use in each process: a pool made in the gunicorn master would not survive the fork
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # spawn, not fork: forking a threaded web worker can copy locks held by other threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=os.nice, initargs=(AUTH_WORKER_NICE,)
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, counter, function, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise AuthBusyError("Too many sign-ins in progress; please try again shortly.")
+
+        with self._lock:
+            self._stats["in_flight"] += 1
+        work = 0.0
+        try:
+            result, work = self._executor().submit(timed_call, function, *args).result()
+        finally:
+            self._slots.release()
+            # Waiting for a slot and then for a free worker process; work is timed inside the worker
+            queued = time.perf_counter() - started - work
+            with self._lock:
+                stats = self._stats
+                stats["in_flight"] -= 1
+                stats[counter] += 1
+                stats["queue_wait"] += queued
+                stats["max_queue_wait"] = max(stats["max_queue_wait"], queued)
+                stats["work"] += work
+                stats["max_work"] = max(stats["max_work"], work)
+        return result
+
+    def hash(self, password):
+        """
+        Returns a hash of password with the configured method.
+        """
+        password_hash = self._run("hashed", generate_password_hash, password, self.method, self.salt_length)
+        self._method_prefix = password_hash.split("$", 1)[0]
+        return password_hash
+
+    def verify(self, password_hash, password):
+        """
+        Returns True if password matches password_hash, whatever method produced it.
+        """
+        return self._run("verified", check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Returns True if password_hash was made with other hash parameters than the configured ones.
+        May raise AuthBusyError the first time, before this process has hashed anything.
+        """
+        if self._method_prefix is None:
+            # werkzeug expands short names ("scrypt") into full parameters; hash once, like any other hash, to learn them
+            self.hash("")
+        return password_hash.split("$", 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        """
+        Stops the worker processes (called when a web worker exits).
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pool_pid == os.getpid():
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        """
+        Snapshot of the pool for this process: hashes and verifications done, requests
+        rejected after the queue timeout, and average/max queue wait (for a slot and a
+        free worker process) and hashing time (in the worker).
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        done = stats["hashed"] + stats["verified"]
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "in_flight": stats["in_flight"],
+            "hashed": stats["hashed"],
+            "verified": stats["verified"],
+            "rejected": stats["rejected"],
+            "avg_queue_wait_ms": round(1000 * stats["queue_wait"] / done, 3) if done else 0.0,
+            "max_queue_wait_ms": round(1000 * stats["max_queue_wait"], 3),
+            "avg_hash_ms": round(1000 * stats["work"] / done, 3) if done else 0.0,
+            "max_hash_ms": round(1000 * stats["max_work"], 3),
+        }
+
+
+# Shared password hasher for the process (Flask app)
+password_hasher = PasswordHasher()
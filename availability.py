@@ -0,0 +1,99 @@
+import os
+from sqlalchemy import select, exists, func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import Vehicle, Rental
+from catalog import page_by_vehicle_id
+
+CANCELLED_STATUS = "Cancelled"
+# Vehicles per page of search results, and the most a request may ask for
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = 100
+# SQLSTATE PostgreSQL raises when ex_rentals_vehicle_period rejects an overlapping booking
+EXCLUSION_VIOLATION = "23P01"
+
+
+class VehicleUnavailableError(Exception):
+    """
+    Raised when a vehicle is already rented for some of the requested dates.
+    """
+
+
+def overlapping_rentals(vehicle_id, start_date, end_date):
+    """
+    Query for the vehicle's rentals that overlap [start_date, end_date], both days
+    inclusive. Cancelled rentals do not hold the vehicle. Served by ix_rentals_vehicle_period.
+    """
+    return select(Rental.rental_id).where(
+        Rental.vehicle_id == vehicle_id,
+        Rental.pickup_date <= end_date,
+        Rental.return_date >= start_date,
+        Rental.rental_status != CANCELLED_STATUS,
+    )
+
+
+def is_available(session: Session, vehicle_id, start_date, end_date):
+    """
+    Returns True if no rental holds the vehicle on any day of [start_date, end_date].
+    """
+    return not session.execute(select(exists(overlapping_rentals(vehicle_id, start_date, end_date)))).scalar()
+
+
+def available_vehicles(session: Session, start_date, end_date, city=None, state=None, vehicle_type=None, max_daily_rate=None, after=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Returns (vehicles, next_after): up to limit vehicles free for every day of
+    [start_date, end_date] that match the filters, by vehicle_id, and the id to pass
+    as after for the next page (None on the last page).
+
+    City and state match case-insensitively through ix_vehicles_location. Booked vehicles
+    are removed with a NOT EXISTS anti-join: narrow searches probe ix_rentals_vehicle_period
+    once per candidate vehicle, wide ones collect the overlapping rentals through
+    ix_rentals_return_period. Neither reads the whole rental history.
+    """
+    query = select(Vehicle).where(~exists(overlapping_rentals(Vehicle.vehicle_id, start_date, end_date)))
+    if state:
+        query = query.where(func.lower(Vehicle.location_state) == state.strip().lower())
+    if city:
+        query = query.where(func.lower(Vehicle.location_city) == city.strip().lower())
+    if vehicle_type:
+        query = query.where(Vehicle.type == vehicle_type)
+    if max_daily_rate is not None:
+        query = query.where(Vehicle.daily_rate <= max_daily_rate)
+    return page_by_vehicle_id(session, query, after, limit)
+
+
+def lock_vehicle(session: Session, vehicle_id):
+    """
+    Serializes bookings of one vehicle until the transaction ends. Must be called
+    before the transaction writes anything.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        # No row locks: take the database write lock up front, so no other booking can commit between check and insert
+        session.execute(text("BEGIN IMMEDIATE"))
+    else:
+        session.execute(select(Vehicle.vehicle_id).where(Vehicle.vehicle_id == vehicle_id).with_for_update())
+
+
+def book_vehicle(session: Session, rental):
+    """
+    Adds rental if its vehicle is free for its dates, or raises VehicleUnavailableError.
+
+    The vehicle is locked before the availability check, so concurrent bookings of it
+    are checked one at a time; on PostgreSQL the ex_rentals_vehicle_period exclusion
+    constraint also rejects overlaps written by anything else. The rental is flushed
+    and the vehicle stays locked until the caller commits.
+    """
+    lock_vehicle(session, rental.vehicle_id)
+    if not is_available(session, rental.vehicle_id, rental.pickup_date, rental.return_date):
+        session.rollback()
+        raise VehicleUnavailableError(f"Vehicle {rental.vehicle_id} is already rented for the selected dates.")
+
+    session.add(rental)
+    try:
+        session.flush()
+    except IntegrityError as e:
+        session.rollback()
+        if getattr(e.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+            raise VehicleUnavailableError(f"Vehicle {rental.vehicle_id} is already rented for the selected dates.") from e
+        raise
+    return rental
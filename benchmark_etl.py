@@ -0,0 +1,107 @@
+"""
+Benchmark of the ETL transform engines: row-by-row ("python") vs vectorized ("pandas").
+
+Seeds a scratch database with synthetic users, vehicles and rentals, then runs a
+full ETL rebuild with each engine and reports per-stage times and throughput.
+The database given by --database-url is wiped, so never point it at real data.
+
+    python benchmark_etl.py --sizes 100000 1000000
+    python benchmark_etl.py --database-url postgresql://localhost/etl_bench --sizes 100000
+"""
+import os
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description="Compare the python and pandas ETL transform engines.")
+parser.add_argument("--database-url", default="sqlite:///benchmark_etl.db", help="Scratch database (it is wiped)")
+parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000], help="Rental counts to benchmark")
+parser.add_argument("--chunk-size", type=int, default=5000)
+args = parser.parse_args()
+
+# database.py reads DATABASE_URL at import time
+os.environ["DATABASE_URL"] = args.database_url
+
+from sqlalchemy import insert, text
+from database import Base, engine, User, Vehicle, Rental
+from etl_process import run_etl
+
+USERS = 1000
+VEHICLES = 1500
+SEED_BATCH = 10000
+
+
+def seed(rentals):
+    """
+    Recreates the schema and inserts synthetic users, vehicles and rentals.
+    """
+    random.seed(42)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {
+                "first_name": f"First{i}", "last_name": f"Last{i}", "username": f"user{i}",
+                "password_hash": "-", "email": f"user{i}@example.com", "phone_number": "555-0100",
+                "city": random.choice(["Seattle", "Austin", "Denver"]), "state": random.choice(["WA", "TX", "CO"]),
+                "age": random.randint(18, 70), "license_number": f"LIC{i}",
+            }
+            for i in range(USERS)
+        ])
+        connection.execute(insert(Vehicle), [
+            {
+                "make": random.choice(["Tesla", "Toyota", "Ford"]), "model": f"Model {i}", "year": 2020,
+                "type": random.choice(["suv", "car", "minivan"]), "daily_rate": random.randint(30, 200),
+                "location_city": "Seattle", "location_state": "WA",
+            }
+            for i in range(VEHICLES)
+        ])
+
+        for start in range(0, rentals, SEED_BATCH):
+            batch = []
+            for _ in range(min(SEED_BATCH, rentals - start)):
+                pickup = now - timedelta(days=random.randint(1, 365))
+                batch.append({
+                    "user_id": random.randint(1, USERS), "vehicle_id": random.randint(1, VEHICLES),
+                    "pickup_date": pickup, "return_date": pickup + timedelta(days=random.randint(1, 14)),
+                    "pickup_location": "Seattle", "return_location": "Seattle",
+                    "total_cost": random.randint(30, 2000), "rental_status": "Completed",
+                    "created_at": now, "updated_at": now,
+                })
+            connection.execute(insert(Rental), batch)
+
+
+def benchmark(transform_engine):
+    """
+    Runs a full rebuild into an empty rental_summary and returns the summed stage timings.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM rental_summary"))
+
+    started = time.perf_counter()
+    stats = run_etl(full_refresh=True, chunk_size=args.chunk_size, workers=1, transform_engine=transform_engine)
+    total = time.perf_counter() - started
+    if stats["error"]:
+        raise RuntimeError(stats["error"])
+
+    stages = {
+        stage: sum(partition[f"{stage}_seconds"] for partition in stats["partitions"])
+        for stage in ("extract", "transform", "load")
+    }
+    return stats["processed"], total, stages
+
+
+if __name__ == "__main__":
+    print(f"Database: {engine.dialect.name}, chunk size {args.chunk_size}")
+    for size in args.sizes:
+        print(f"\nSeeding {size} rentals...")
+        seed(size)
+        for transform_engine in ("python", "pandas"):
+            processed, total, stages = benchmark(transform_engine)
+            print(
+                f"{transform_engine:>6}: {processed} rentals in {total:.1f}s ({processed / total:,.0f} rows/s) | "
+                f"extract {stages['extract']:.1f}s, transform {stages['transform']:.1f}s, load {stages['load']:.1f}s"
+            )
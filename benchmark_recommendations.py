@@ -0,0 +1,108 @@
+"""
+Benchmark of the recommendation pair counting engines: per-user loops ("mapreduce"),
+the sparse matrix product ("sparse") and the MapReduce over a process pool ("parallel").
+
+Generates synthetic rental histories, counts co-rented vehicle pairs with each
+engine, checks that the counts match and reports the time each engine took. The
+sparse engine is timed both with its raw count arrays and with the pair dict that
+map_phase returns; building that dict of tuples is most of its cost. The parallel
+engine also runs the reduce phase, so it is compared with map_phase + reduce_phase.
+Its workers read their users from the database, so the rentals are also written to
+recommendation_rentals in the database given by --database-url, which is wiped.
+
+    python benchmark_recommendations.py --vehicles 10000 20000 --users 50000
+"""
+import os
+import time
+import argparse
+from collections import namedtuple
+from operator import itemgetter
+import numpy as np
+
+parser = argparse.ArgumentParser(description="Compare the mapreduce and sparse recommendation engines.")
+parser.add_argument("--vehicles", type=int, nargs="+", default=[10000, 20000], help="Fleet sizes to benchmark")
+parser.add_argument("--users", type=int, default=50000)
+parser.add_argument("--rentals-per-user", type=int, default=12, help="Mean rentals per user")
+parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8], help="Pool sizes for the parallel engine")
+parser.add_argument("--database-url", default="sqlite:///benchmark_recommendations.db", help="Scratch database for the parallel engine (it is wiped)")
+args = parser.parse_args()
+
+# database.py reads DATABASE_URL at import time, and the parallel engine's workers inherit it
+os.environ["DATABASE_URL"] = args.database_url
+
+from sqlalchemy import insert
+from database import engine, RecommendationRental
+from recommendation_system import map_phase, reduce_phase, cooccurrence_counts, cooccurrence_phase, parallel_map_reduce
+
+RentalRow = namedtuple("RentalRow", ["user_id", "vehicle_id"])
+
+
+def generate_rentals(vehicles, users, rentals_per_user):
+    """
+    Returns parallel user_id / vehicle_id arrays. Vehicle popularity is skewed
+    (Zipf-like) so a few vehicles are co-rented with many others, as in a real fleet.
+    """
+    rng = np.random.default_rng(42)
+    counts = rng.poisson(rentals_per_user, size=users) + 1
+    user_ids = np.repeat(np.arange(1, users + 1), counts)
+
+    popularity = 1.0 / np.arange(1, vehicles + 1) ** 0.8
+    vehicle_ids = rng.choice(np.arange(1, vehicles + 1), size=len(user_ids), p=popularity / popularity.sum())
+    return user_ids, vehicle_ids
+
+
+def store_rentals(user_ids, vehicle_ids):
+    """
+    Replaces recommendation_rentals with the synthetic rentals, where the parallel engine reads them.
+    """
+    RecommendationRental.__table__.drop(engine, checkfirst=True)
+    RecommendationRental.__table__.create(engine)
+    rows = [
+        {"rental_id": rental_id, "user_id": user_id, "vehicle_id": vehicle_id}
+        for rental_id, (user_id, vehicle_id) in enumerate(zip(user_ids.tolist(), vehicle_ids.tolist()), start=1)
+    ]
+    with engine.begin() as connection:
+        for start in range(0, len(rows), 10000):
+            connection.execute(insert(RecommendationRental), rows[start:start + 10000])
+
+
+if __name__ == "__main__":
+    for vehicles in args.vehicles:
+        user_ids, vehicle_ids = generate_rentals(vehicles, args.users, args.rentals_per_user)
+        rentals = [RentalRow(u, v) for u, v in zip(user_ids.tolist(), vehicle_ids.tolist())]
+        print(f"\n{vehicles} vehicles, {args.users} users, {len(rentals)} rentals")
+
+        started = time.perf_counter()
+        expected = map_phase(rentals)
+        mapreduce_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cooccurrence_counts(user_ids, vehicle_ids)
+        counts_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = cooccurrence_phase(user_ids, vehicle_ids)
+        sparse_seconds = time.perf_counter() - started
+
+        if actual != expected:
+            raise AssertionError("sparse engine co_rent_count differs from mapreduce")
+
+        print(f"mapreduce: {mapreduce_seconds:.2f}s ({len(expected)} pairs)")
+        print(f"   sparse: {sparse_seconds:.2f}s as a pair dict ({mapreduce_seconds / sparse_seconds:.1f}x faster), "
+              f"{counts_seconds:.2f}s as arrays ({mapreduce_seconds / counts_seconds:.1f}x faster)")
+
+        started = time.perf_counter()
+        expected = reduce_phase(map_phase(rentals))
+        serial_seconds = time.perf_counter() - started
+        expected.sort(key=itemgetter("vehicle_id_1", "vehicle_id_2"))
+
+        store_rentals(user_ids, vehicle_ids)
+        for workers in args.workers:
+            started = time.perf_counter()
+            actual = parallel_map_reduce(workers=workers)
+            parallel_seconds = time.perf_counter() - started
+
+            if sorted(actual, key=itemgetter("vehicle_id_1", "vehicle_id_2")) != expected:
+                raise AssertionError("parallel engine recommendations differ from mapreduce")
+            print(f" parallel: {parallel_seconds:.2f}s with {workers} workers "
+                  f"(map + reduce; serial {serial_seconds:.2f}s, speedup {serial_seconds / parallel_seconds:.1f}x)")
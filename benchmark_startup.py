@@ -0,0 +1,87 @@
+"""
+Benchmark of process startup: the cost of importing each entry point.
+
+Every import runs in a fresh interpreter and reports its wall time, the database
+connections it opened and statements it ran, how many modules it loaded, and
+whether it pulled in Streamlit. Pass several --tree checkouts to compare them,
+e.g. the tree before and after a change:
+
+    git worktree add /tmp/drive-mate-before HEAD~1
+    python benchmark_startup.py --tree /tmp/drive-mate-before .
+    python benchmark_startup.py --database-url postgresql://localhost/startup_bench --repeat 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+parser = argparse.ArgumentParser(description="Measure the import cost of each entry point.")
+parser.add_argument("--database-url", default="sqlite:///benchmark_startup.db", help="Database the entry points connect to (its schema is created if missing)")
+parser.add_argument("--tree", nargs="+", default=["."], help="Checkouts of the repository to compare")
+parser.add_argument("--entry-points", nargs="+", default=["database", "app", "etl_process", "recommendation_system", "alembic/env.py"],
+                    help="Modules to import; alembic/env.py stands for an Alembic run, which imports database")
+parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per entry point (the median is reported)")
+args = parser.parse_args()
+
+# Each tree is imported from its own directory: pin a relative SQLite path to this one
+if args.database_url.startswith("sqlite:///") and not args.database_url.startswith("sqlite:////"):
+    args.database_url = "sqlite:///" + os.path.abspath(args.database_url[len("sqlite:///"):])
+
+# database.py reads DATABASE_URL at import time
+os.environ["DATABASE_URL"] = args.database_url
+
+# Runs in the child interpreter. SQLAlchemy is loaded before the clock starts so the
+# connection and statement counters can be attached; every tree pays for it the same.
+PROBE = """
+import sys, time, json
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+counts = {"connections": 0, "statements": 0}
+event.listen(Pool, "connect", lambda *_: counts.__setitem__("connections", counts["connections"] + 1))
+event.listen(Engine, "before_cursor_execute", lambda *_: counts.__setitem__("statements", counts["statements"] + 1))
+modules_before = len(sys.modules)
+started = time.perf_counter()
+import %s
+seconds = time.perf_counter() - started
+print("STARTUP " + json.dumps(dict(counts, seconds=seconds, modules=len(sys.modules) - modules_before, streamlit="streamlit" in sys.modules)))
+"""
+
+
+def measure(tree, entry_point):
+    """
+    Imports entry_point in a fresh interpreter rooted at tree; returns the probe's report.
+    """
+    # Alembic's env.py only runs under the alembic command; importing database is what it costs
+    module = "database" if entry_point == "alembic/env.py" else entry_point
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE % module],
+        cwd=tree, env=dict(os.environ, PYTHONPATH=os.path.abspath(tree)),
+        capture_output=True, text=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            return json.loads(line[len("STARTUP "):])
+    raise RuntimeError(f"Importing {module} in {tree} failed:\n{completed.stderr.strip()[-2000:]}")
+
+
+def main():
+    # Entry points no longer create tables on import, so make sure the schema exists first
+    from database import init_db
+    init_db()
+
+    print(f"{'tree':<32} {'entry point':<24} {'import ms':>10} {'connections':>12} {'statements':>11} {'modules':>8}  streamlit")
+    for tree in args.tree:
+        for entry_point in args.entry_points:
+            runs = [measure(tree, entry_point) for _ in range(args.repeat)]
+            last = runs[-1]
+            print(
+                f"{tree:<32} {entry_point:<24} {1000 * statistics.median(run['seconds'] for run in runs):>10.1f} "
+                f"{last['connections']:>12} {last['statements']:>11} {last['modules']:>8}  {'yes' if last['streamlit'] else 'no'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from database import Vehicle
+
+# Vehicles per catalog page, and the most a request may ask for
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "20"))
+CATALOG_MAX_PAGE_SIZE = 100
+
+
+def page_by_vehicle_id(session: Session, query, after=None, limit=CATALOG_PAGE_SIZE):
+    """
+    Keyset pagination: runs a select(Vehicle) query for the limit vehicles after vehicle_id
+    after, in vehicle_id order. Returns (vehicles, next_after), where next_after is the
+    after for the next page, or None on the last page. Every page costs the same
+    primary key range scan, however deep it is.
+    """
+    if after is not None:
+        query = query.where(Vehicle.vehicle_id > after)
+
+    # One extra row tells whether another page follows
+    vehicles = session.scalars(query.order_by(Vehicle.vehicle_id).limit(limit + 1)).all()
+    if len(vehicles) > limit:
+        return vehicles[:limit], vehicles[limit - 1].vehicle_id
+    return vehicles, None
+
+
+def vehicle_catalog(session: Session, make=None, vehicle_type=None, state=None, min_daily_rate=None, max_daily_rate=None, after=None, limit=CATALOG_PAGE_SIZE):
+    """
+    Returns one page of the vehicle catalog as (vehicles, next_after). make matches
+    the start of the make and state the whole state, both case-insensitively.
+    """
+    query = select(Vehicle)
+    if make:
+        query = query.where(func.lower(Vehicle.make).startswith(make.strip().lower(), autoescape=True))
+    if vehicle_type:
+        query = query.where(Vehicle.type == vehicle_type)
+    if state:
+        query = query.where(func.lower(Vehicle.location_state) == state.strip().lower())
+    if min_daily_rate is not None:
+        query = query.where(Vehicle.daily_rate >= min_daily_rate)
+    if max_daily_rate is not None:
+        query = query.where(Vehicle.daily_rate <= max_daily_rate)
+    return page_by_vehicle_id(session, query, after, limit)
@@ -0,0 +1,21 @@
+import os
+import tempfile
+import pytest
+
+# load_test.py matches pytest's *_test.py pattern but is a command-line load generator
+collect_ignore = ["load_test.py"]
+
+# Tests run against a throwaway SQLite database, never the one in .env; database.py reads DATABASE_URL at import
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="drive-mate-tests-"), "test.db")
+
+
+@pytest.fixture
+def database():
+    """
+    Creates the schema for one test and drops it afterwards.
+    """
+    from database import Base, engine
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+    Base.metadata.drop_all(engine)
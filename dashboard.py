@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
 from sqlalchemy.orm import sessionmaker
-from database import engine, User, Vehicle, Rental, RentalSummary
-from etl_process import run_etl
+from database import engine, User, Vehicle, Rental
+from etl_jobs import etl_runner
+from etl_process import latest_run, recent_runs
 import matplotlib.pyplot as plt
 
 # Database session setup
@@ -12,26 +13,79 @@ session = Session()
 st.title("Vehicle Rental System Dashboard")
 st.sidebar.header("Insights Menu")
 
+# Test Database Connection (on the shared engine, so it costs one pooled connection)
+def test_connection():
+    try:
+        with engine.connect():
+            st.success("✅ Successfully connected to the database!")
+            return True
+    except Exception as e:
+        st.error(f"❌ Failed to connect to the database: {e}")
+        return False
+
+# Test connection on app load
+if test_connection():
+    st.info("You can now fetch and display data from your database.")
+else:
+    st.warning("Check your DATABASE_URL and database credentials.")
+
 # Function to display ETL status
 def display_etl_status():
     try:
-        # Fetch the ETL status
-        summary_records = session.query(RentalSummary).all()
-        total_records = len(summary_records)
-        last_updated = (
-            max(record.last_updated for record in summary_records)
-            if total_records > 0
-            else None
-        )
+        # Fetch the ETL status from the latest successful run in the ledger
+        last_run = latest_run(session, status="succeeded")
+        total_records = last_run.summary_rows if last_run else 0
+        last_updated = last_run.finished_at if last_run else None
 
         st.subheader("ETL Monitoring Page")
         st.write(f"**Total Records:** {total_records}")
         st.write(f"**Last Updated:** {last_updated if last_updated else 'No updates yet'}")
 
-        # Button to trigger ETL process
+        # Button to queue the ETL process on the background runner
         if st.button("Run ETL Process"):
-            run_etl()
-            st.success("ETL process completed successfully!")
+            if etl_runner.submit():
+                st.success("ETL process queued.")
+            else:
+                st.info("An ETL run is already in progress; your request was merged into it.")
+
+        # Show the state of the current (or last) background run
+        job = etl_runner.status()
+        st.write(f"**ETL Job State:** {job['status']}")
+        if job["status"] != "idle":
+            total = job["rows_total"]
+            st.progress(job["rows_processed"] / total if total else 0.0,
+                        text=f"{job['rows_processed']} / {total if total is not None else '?'} rows")
+            if job["duration"] is not None:
+                st.write(f"**Duration:** {job['duration']:.1f} s")
+            if job["error"]:
+                st.error(f"ETL run failed: {job['error']}")
+        if job["status"] in ("queued", "running"):
+            st.button("Refresh Status")
+
+        # History of recent runs and their throughput
+        runs = recent_runs(session)
+        if runs:
+            st.subheader("Recent ETL Runs")
+            history = pd.DataFrame([
+                {
+                    "Run": run.run_id,
+                    "Mode": run.mode,
+                    "Status": run.status,
+                    "Started": run.started_at,
+                    "Duration (s)": run.duration_seconds(),
+                    "Extracted": run.rows_extracted,
+                    "Inserted": run.rows_inserted,
+                    "Updated": run.rows_updated,
+                    "Skipped": run.rows_skipped,
+                    "Extract (s)": run.extract_seconds,
+                    "Transform (s)": run.transform_seconds,
+                    "Load (s)": run.load_seconds,
+                    "Rows/s": run.throughput(),
+                    "Error": run.error,
+                }
+                for run in runs
+            ])
+            st.dataframe(history, hide_index=True)
     except Exception as e:
         st.error(f"Error fetching or running ETL: {e}")
 
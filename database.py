@@ -3,11 +3,14 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Text, DateTime, DECIMAL
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+import time
+import threading
+from sqlalchemy import create_engine, make_url, exc, event, func, DDL, Column, Integer, String, Float, ForeignKey, Text, DateTime, DECIMAL, JSON, UniqueConstraint, Index
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base, relationship
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
-import streamlit as st
 
 # Fetch the DATABASE_URL from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -15,30 +18,109 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
+# Connection pool, per process: size x workers must stay under the server's max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds before a connection is replaced, so server or firewall idle timeouts never close one under us
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout and transparently reconnect if the server dropped it
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that also records how long checkouts wait for a connection, and how
+    many give up after DB_POOL_TIMEOUT.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.reset_wait_stats()
+
+    def reset_wait_stats(self):
+        with self._stats_lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+
+def engine_options(url):
+    """
+    Pool settings for url. In-memory SQLite keeps SQLAlchemy's single-connection pool.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
 # Set up the database connection
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+# One session per thread (so per Flask request); the app removes it when the request ends
+db_session = scoped_session(SessionLocal)
+
 
-# Test Database Connection
-def test_connection():
-    try:
-        engine = create_engine(DATABASE_URL)
-        with engine.connect() as connection:
-            st.success("✅ Successfully connected to the database!")
-            return True
-    except Exception as e:
-        st.error(f"❌ Failed to connect to the database: {e}")
-        return False
-
-# Streamlit App
-st.title("Vehicle Rental Dashboard")
-
-# Test connection on app load
-if test_connection():
-    st.info("You can now fetch and display data from your database.")
-else:
-    st.warning("Check your DATABASE_URL and database credentials.")
+def pool_stats():
+    """
+    Snapshot of the engine's connection pool: connections checked out, idle and in
+    overflow, and how long checkouts waited for one.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    stats = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                timeouts=pool.timeouts,
+                avg_wait_ms=round(1000 * pool.total_wait / pool.checkouts, 3) if pool.checkouts else 0.0,
+                max_wait_ms=round(1000 * pool.max_wait, 3),
+            )
+    return stats
+
+# SQLite (local testing): write-ahead logging lets the ETL commit chunks while its extract is still streaming
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def enable_sqlite_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+Base = declarative_base()
 
 # Define User model
 class User(Base):
@@ -85,6 +167,13 @@ class Vehicle(Base):
     location_latitude = Column(Float, nullable=True)
     location_longitude = Column(Float, nullable=True)
 
+    # Availability search by location and catalog search by make prefix, both case-insensitive
+    # (see availability.py and catalog.py); text_pattern_ops lets PostgreSQL use the make index for LIKE 'prefix%'
+    __table_args__ = (
+        Index('ix_vehicles_location', func.lower(location_state), func.lower(location_city)),
+        Index('ix_vehicles_make', func.lower(make).label('make_lower'), postgresql_ops={'make_lower': 'text_pattern_ops'}),
+    )
+
     # Relationships
     rentals = relationship("Rental", back_populates="vehicle")
 
@@ -101,14 +190,31 @@ class Rental(Base):
     total_cost = Column(DECIMAL, nullable=False)
     rental_status = Column(String, nullable=False, default="Ongoing")
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Change timestamp for incremental ETL
+
+    # Availability checks: a vehicle's rentals by date, and all rentals still out on a date (see availability.py)
+    __table_args__ = (
+        Index('ix_rentals_vehicle_period', 'vehicle_id', 'pickup_date', 'return_date'),
+        Index('ix_rentals_return_period', 'return_date', 'pickup_date'),
+    )
 
     # Relationships
     user = relationship("User", back_populates="rentals")
     vehicle = relationship("Vehicle", back_populates="rentals")
 
+# PostgreSQL: no two live bookings of a vehicle may overlap (dates inclusive). Cancelled and completed
+# rentals are left out, so past history may overlap. int4range(vehicle_id, vehicle_id) stands in for
+# btree_gist's integer equality, which not every server has installed.
+event.listen(Rental.__table__, "after_create", DDL(
+    "ALTER TABLE rentals ADD CONSTRAINT ex_rentals_vehicle_period EXCLUDE USING gist "
+    "(int4range(vehicle_id, vehicle_id, '[]') WITH &&, tsrange(pickup_date, return_date, '[]') WITH &&) "
+    "WHERE (rental_status NOT IN ('Cancelled', 'Completed'))"
+).execute_if(dialect="postgresql"))
+
 # Define RentalSummary model
 class RentalSummary(Base):
     __tablename__ = 'rental_summary'
+    __table_args__ = (UniqueConstraint('rental_id', name='uq_rental_summary_rental_id'),)  # One summary per rental, used as the upsert key
     summary_id = Column(Integer, primary_key=True, index=True)
     rental_id = Column(Integer, ForeignKey('rentals.rental_id'), nullable=False)
     user_name = Column(String, nullable=False)
@@ -120,12 +226,64 @@ class RentalSummary(Base):
     rental_category = Column(String, nullable=True)  # Optional category field
     last_updated = Column(DateTime, default=datetime.utcnow)
 
+# Define EtlWatermark model
+class EtlWatermark(Base):
+    __tablename__ = 'etl_watermarks'
+    job_name = Column(String, primary_key=True)  # e.g. "rental_summary"
+    high_water_mark = Column(DateTime, nullable=True)  # Latest change timestamp processed by the last successful run
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Define EtlRun model (run ledger, one row per ETL run)
+class EtlRun(Base):
+    __tablename__ = 'etl_runs'
+    run_id = Column(Integer, primary_key=True, index=True)
+    mode = Column(String, nullable=False)  # "full" or "incremental"
+    status = Column(String, nullable=False, default="running")  # running, succeeded or failed
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    rows_extracted = Column(Integer, nullable=False, default=0)
+    rows_inserted = Column(Integer, nullable=False, default=0)
+    rows_updated = Column(Integer, nullable=False, default=0)
+    rows_skipped = Column(Integer, nullable=False, default=0)
+    rows_total = Column(Integer, nullable=True)  # Rentals in the run's window; rows_extracted counts up to it while it runs
+    extract_seconds = Column(Float, nullable=True)
+    transform_seconds = Column(Float, nullable=True)
+    load_seconds = Column(Float, nullable=True)
+    summary_rows = Column(Integer, nullable=True)  # Size of rental_summary after a successful run
+    error = Column(Text, nullable=True)
+    window_start = Column(DateTime, nullable=True)  # Change window (window_start, window_end] processed by the run
+    window_end = Column(DateTime, nullable=True)
+    resumed_from = Column(Integer, ForeignKey('etl_runs.run_id'), nullable=True)  # Failed run this run continued
+
+    # Wall-clock duration of the run in seconds
+    def duration_seconds(self):
+        if not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    # Rentals extracted per second of wall-clock time
+    def throughput(self):
+        duration = self.duration_seconds()
+        return self.rows_extracted / duration if duration else None
+
+# Define EtlCheckpoint model (progress of one rental_id partition of an ETL run)
+class EtlCheckpoint(Base):
+    __tablename__ = 'etl_checkpoints'
+    checkpoint_id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey('etl_runs.run_id'), nullable=False, index=True)
+    start_key = Column(Integer, nullable=True)  # Partition bounds on rental_id (None means unbounded)
+    end_key = Column(Integer, nullable=True)
+    checkpoint_key = Column(Integer, nullable=True)  # Last rental_id committed
+    status = Column(String, nullable=False, default="pending")  # pending, done or failed
+    error = Column(Text, nullable=True)
+
 # Define VehicleRecommendations model
 class VehicleRecommendations(Base):
     __tablename__ = 'vehicle_recommendations'
+    __table_args__ = (UniqueConstraint('vehicle_id_1', 'vehicle_id_2', name='uq_vehicle_recommendations_pair'),)  # One row per pair, used as the upsert key
     recommendation_id = Column(Integer, primary_key=True, index=True)
     vehicle_id_1 = Column(Integer, ForeignKey('vehicles.vehicle_id'), nullable=False)
-    vehicle_id_2 = Column(Integer, ForeignKey('vehicles.vehicle_id'), nullable=False)
+    vehicle_id_2 = Column(Integer, ForeignKey('vehicles.vehicle_id'), nullable=False, index=True)  # Lookups from either side of a pair
     co_rent_count = Column(Integer, nullable=False)  # Number of times both vehicles were rented together
     recommendation_score = Column(Float, nullable=True)  # Optional score for recommendation strength
     last_updated = Column(DateTime, default=datetime.utcnow)
@@ -134,6 +292,54 @@ class VehicleRecommendations(Base):
     vehicle1 = relationship("Vehicle", foreign_keys=[vehicle_id_1])
     vehicle2 = relationship("Vehicle", foreign_keys=[vehicle_id_2])
 
+# Define UserRecommendation model (per-user top-N cache, one row per user)
+class UserRecommendation(Base):
+    __tablename__ = 'user_recommendations'
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, autoincrement=False)
+    vehicle_ids = Column(JSON, nullable=False)  # Recommended vehicle ids, best first
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+# Define PopularVehicles model (cold-start recommendations: most rented vehicles per location)
+class PopularVehicles(Base):
+    __tablename__ = 'popular_vehicles'
+    # Normalized (stripped, lowercase) location; '' city is the whole state, '' state and city the whole fleet
+    location_state = Column(String, primary_key=True)
+    location_city = Column(String, primary_key=True)
+    vehicle_ids = Column(JSON, nullable=False)  # Most rented first
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+# Define RecommendationRental model (rentals counted in vehicle_recommendations, for incremental updates)
+class RecommendationRental(Base):
+    __tablename__ = 'recommendation_rentals'
+    rental_id = Column(Integer, primary_key=True, autoincrement=False)  # No foreign key: rows outlive deleted rentals until the next run
+    user_id = Column(Integer, nullable=False, index=True)
+    vehicle_id = Column(Integer, nullable=False)
+
+# Define RentalDeletion model (rentals deleted since the last recommendation run)
+class RentalDeletion(Base):
+    __tablename__ = 'rental_deletions'
+    deletion_id = Column(Integer, primary_key=True)
+    rental_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+# Log rentals deleted through the ORM so incremental recommendation runs can decrement their pairs.
+# Bulk deletes (Query.delete, raw SQL) bypass this; run a full recommendation rebuild after those.
+@event.listens_for(Rental, "after_delete")
+def log_rental_deletion(mapper, connection, target):
+    connection.execute(RentalDeletion.__table__.insert().values(rental_id=target.rental_id, deleted_at=datetime.utcnow()))
+
+# Dialect-specific INSERT supporting ON CONFLICT upserts
+def insert_for_dialect(session, model):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Upserts are not supported on the {dialect} dialect")
+
 # Initialize the database
 def init_db():
     Base.metadata.create_all(bind=engine)
+
+if __name__ == "__main__":
+    init_db()
@@ -0,0 +1,126 @@
+import threading
+from datetime import datetime
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from etl_process import run_etl, latest_run, EtlLock
+
+
+class EtlJobRunner:
+    """
+    Runs the ETL process on a background thread so callers return immediately.
+
+    Only one run is active at a time: a trigger that arrives while a run is
+    queued or running is coalesced into that run instead of starting another.
+    The running state and progress come from the etl_runs ledger, so every
+    web worker (and the dashboard) sees runs started by any process; only a
+    run queued here but not yet started is tracked in this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._job = {"status": "idle"}
+
+    def submit(self, **options):
+        """
+        Queues an ETL run with the given run_etl options.
+        Returns True if a new run was queued, False if it was coalesced into the active one.
+        """
+        if self.status()["status"] in ("queued", "running"):
+            return False
+
+        with self._lock:
+            if self._job["status"] in ("queued", "running"):
+                return False
+
+            self._job = {
+                "status": "queued",
+                "options": options,
+                "queued_at": datetime.utcnow(),
+                "started_at": None,
+                "finished_at": None,
+                "rows_processed": 0,
+                "rows_total": None,
+                "result": None,
+                "error": None,
+            }
+
+        thread = threading.Thread(target=self._run, args=(options,), name="etl-job", daemon=True)
+        thread.start()
+        return True
+
+    def status(self):
+        """
+        Returns a snapshot of the current (or last) run, including its duration in seconds.
+        """
+        with self._lock:
+            job = dict(self._job)
+
+        if job["status"] != "queued":
+            session = SessionLocal()
+            try:
+                run = latest_run(session)
+                # The ledger has the run unless this process's run failed before recording it
+                if run is not None and (job["status"] == "idle" or run.started_at >= job["queued_at"]):
+                    job = ledger_job(session, run)
+            except Exception:
+                # The ledger is unreachable; report what this process knows
+                session.rollback()
+            finally:
+                session.close()
+
+        if job.get("started_at"):
+            end = job["finished_at"] or datetime.utcnow()
+            job["duration"] = (end - job["started_at"]).total_seconds()
+        else:
+            job["duration"] = None
+        return job
+
+    def _update(self, **fields):
+        with self._lock:
+            self._job.update(fields)
+
+    def _run(self, options):
+        self._update(status="running", started_at=datetime.utcnow())
+        try:
+            result = run_etl(**options)
+            error = result["error"]
+        except Exception as e:
+            result, error = None, str(e)
+
+        if result is not None and result["coalesced"]:
+            # Another process started a run first; the ledger shows that one
+            with self._lock:
+                self._job = {"status": "idle"}
+            return
+
+        self._update(
+            status="failed" if error else "finished",
+            finished_at=datetime.utcnow(),
+            result=result,
+            error=error,
+        )
+
+
+def ledger_job(session: Session, run):
+    """
+    Describes an etl_runs row in the shape of EtlJobRunner.status().
+    """
+    status = {"running": "running", "succeeded": "finished"}.get(run.status, "failed")
+    error = run.error
+    if status == "running" and not EtlLock.held(session):
+        # Its process died without recording the outcome; --resume continues it
+        status, error = "failed", "Interrupted before completion"
+    return {
+        "status": status,
+        "run_id": run.run_id,
+        "queued_at": None,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+        "rows_processed": run.rows_extracted,
+        "rows_total": run.rows_total,
+        "error": error,
+    }
+
+
+# Shared runner for the process (Flask app or Streamlit dashboard)
+etl_runner = EtlJobRunner()
@@ -1,106 +1,708 @@
+import io
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import func, select, text
 from sqlalchemy.orm import Session
-from database import SessionLocal, Rental, User, Vehicle, RentalSummary
-from datetime import datetime
+from database import engine, SessionLocal, Rental, User, Vehicle, RentalSummary, EtlWatermark, EtlRun, EtlCheckpoint, insert_for_dialect
+from datetime import datetime, timedelta
 import pytz
 
 # Define time zones
 utc = pytz.utc
 est = pytz.timezone('US/Eastern')
 
-def extract_data(session: Session):
+# Number of rentals fetched, transformed and loaded per chunk
+ETL_CHUNK_SIZE = int(os.getenv("ETL_CHUNK_SIZE", "5000"))
+
+# Number of summaries written per INSERT ... ON CONFLICT statement
+ETL_BATCH_SIZE = int(os.getenv("ETL_BATCH_SIZE", "1000"))
+
+# Worker processes for a parallel run; keep within the database's connection budget (2 connections per worker)
+ETL_WORKERS = int(os.getenv("ETL_WORKERS", "1"))
+
+# Transform engine: "python" builds records row by row, "pandas" transforms each chunk with column operations
+ETL_TRANSFORM_ENGINE = os.getenv("ETL_TRANSFORM_ENGINE", "python")
+
+# Columns produced by transform_data and written by load_data
+SUMMARY_COLUMNS = [
+    "rental_id", "user_name", "user_location", "vehicle_details", "rental_duration",
+    "total_cost", "rental_status", "rental_category", "last_updated"
+]
+
+# Name under which the rental_summary high-water mark is stored
+ETL_JOB_NAME = "rental_summary"
+
+# Key of the PostgreSQL advisory lock held while an ETL run is active (any fixed bigint)
+ETL_LOCK_KEY = 7210001
+# File locked while an ETL run is active on SQLite (one machine, so a local file is shared by every process)
+ETL_LOCK_FILE = os.getenv("ETL_LOCK_FILE", os.path.join(tempfile.gettempdir(), "drive-mate-etl.lock"))
+
+
+class EtlLock:
     """
-    Extracts data from the rentals, users, and vehicles tables.
+    Lets one ETL run at a time proceed across every process using the database: each
+    web worker has its own etl_runner, and cron or CLI runs have none. PostgreSQL uses
+    a session advisory lock on a dedicated connection, SQLite a lock file.
     """
-    rentals = session.query(Rental).all()
-    return rentals
 
-def transform_data(rentals, session: Session):
+    def __init__(self):
+        self._connection = None
+        self._file = None
+
+    def acquire(self):
+        """
+        Takes the lock without waiting; returns False if another run holds it.
+        """
+        if engine.dialect.name == "postgresql":
+            self._connection = engine.connect()
+            acquired = self._connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ETL_LOCK_KEY}).scalar()
+            # The lock belongs to the database session, so don't sit idle in a transaction while holding it
+            self._connection.commit()
+            if not acquired:
+                self._connection.close()
+                self._connection = None
+            return bool(acquired)
+
+        import fcntl
+        self._file = open(ETL_LOCK_FILE, "a")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._connection is not None:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ETL_LOCK_KEY})
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+        if self._file is not None:
+            # Closing the file drops the lock
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def held(session: Session):
+        """
+        Returns True if some process holds the lock, without taking it on PostgreSQL.
+        """
+        if engine.dialect.name == "postgresql":
+            # A bigint advisory key is stored as classid (high 32 bits), objid (low 32 bits), objsubid 1
+            return session.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND classid = 0 "
+                "AND objid = :key AND objsubid = 1 AND database = (SELECT oid FROM pg_database WHERE datname = current_database()))"
+            ), {"key": ETL_LOCK_KEY}).scalar()
+
+        # flock has no test-only call; a run starting in the instant the probe holds the lock is coalesced
+        probe = EtlLock()
+        if not probe.acquire():
+            return True
+        probe.release()
+        return False
+
+
+# Seconds before the watermark an incremental run starts reading. updated_at is stamped when a
+# change is flushed, not when it commits, so a transaction committing after a run has read its
+# upper bound can hold rows stamped below it; re-reading this overlap picks them up next run.
+ETL_WATERMARK_OVERLAP = int(os.getenv("ETL_WATERMARK_OVERLAP", "300"))
+
+def get_watermark(session: Session, job_name=ETL_JOB_NAME):
+    """
+    Returns the high-water mark of the last successful run, or None if the job has never run.
+    """
+    watermark = session.get(EtlWatermark, job_name)
+    return watermark.high_water_mark if watermark else None
+
+def set_watermark(session: Session, high_water_mark, job_name=ETL_JOB_NAME):
+    """
+    Persists the high-water mark for the job. The caller commits.
+    """
+    watermark = session.get(EtlWatermark, job_name)
+    if watermark is None:
+        watermark = EtlWatermark(job_name=job_name)
+        session.add(watermark)
+    watermark.high_water_mark = high_water_mark
+
+def extract_data(session: Session, since=None, until=None, chunk_size=ETL_CHUNK_SIZE, start_key=None, end_key=None):
+    """
+    Extracts data from the rentals, users, and vehicles tables with a single joined query.
+    Only rentals changed in the window (since, until] are returned when bounds are given,
+    and only rental_ids in [start_key, end_key] when a key range is given.
+
+    Rows are streamed from a server-side cursor and yielded in lists of at most
+    chunk_size, so only one chunk is held in memory at a time. Rentals whose user
+    or vehicle no longer exists are dropped by the inner joins.
+    """
+    query = (
+        select(
+            Rental.rental_id, Rental.pickup_date, Rental.return_date, Rental.total_cost, Rental.rental_status,
+            User.first_name, User.last_name, User.city, User.state,
+            Vehicle.make, Vehicle.model, Vehicle.type
+        )
+        .join(User, User.user_id == Rental.user_id)
+        .join(Vehicle, Vehicle.vehicle_id == Rental.vehicle_id)
+        .order_by(Rental.rental_id)
+    )
+    if since is not None:
+        query = query.where(Rental.updated_at > since)
+    if until is not None:
+        query = query.where(Rental.updated_at <= until)
+    if start_key is not None:
+        query = query.where(Rental.rental_id >= start_key)
+    if end_key is not None:
+        query = query.where(Rental.rental_id <= end_key)
+
+    result = session.execute(query, execution_options={"yield_per": chunk_size})
+    for chunk in result.partitions():
+        yield chunk
+
+def transform_data(rows, last_updated=None):
     """
     Transforms the extracted data into the format required for the RentalSummary table.
+    last_updated is the run timestamp stamped on every record (defaults to now, in EST).
     """
     transformed_data = []
-    
-    for rental in rentals:
-        # Fetch related user and vehicle data
-        user = session.query(User).filter(User.user_id == rental.user_id).first()
-        vehicle = session.query(Vehicle).filter(Vehicle.vehicle_id == rental.vehicle_id).first()
-
-        if not user or not vehicle:
-            continue  # Skip if user or vehicle is not found
 
+    # Get the current UTC time and convert it to EST
+    if last_updated is None:
+        last_updated = datetime.now(utc).astimezone(est)
+    
+    for row in rows:
         # Calculate rental duration in days
-        rental_duration = (rental.return_date - rental.pickup_date).days
+        rental_duration = (row.return_date - row.pickup_date).days
         rental_duration = max(rental_duration, 1)  # Ensure at least 1 day
 
         # Generate rental category (Optional: Add your own logic here)
-        rental_category = "Luxury" if vehicle.type.lower() == "suv" else "Economy"
+        rental_category = "Luxury" if row.type.lower() == "suv" else "Economy"
 
-        # Get the current UTC time and convert it to EST
-        current_utc_time = datetime.now(utc)
-        last_updated_est = current_utc_time.astimezone(est)
-        
         # Create a transformed record
-        transformed_record = RentalSummary(
-            rental_id=rental.rental_id,
-            user_name=f"{user.first_name} {user.last_name}",
-            user_location=f"{user.city}, {user.state}",
-            vehicle_details=f"{vehicle.make} {vehicle.model} - {vehicle.type}",
-            rental_duration=rental_duration,
-            total_cost=rental.total_cost,
-            rental_status=rental.rental_status,
-            rental_category=rental_category,
-            last_updated=last_updated_est  # Store in EST
-        )
+        transformed_record = {
+            "rental_id": row.rental_id,
+            "user_name": f"{row.first_name} {row.last_name}",
+            "user_location": f"{row.city}, {row.state}",
+            "vehicle_details": f"{row.make} {row.model} - {row.type}",
+            "rental_duration": rental_duration,
+            "total_cost": row.total_cost,
+            "rental_status": row.rental_status,
+            "rental_category": rental_category,
+            "last_updated": last_updated  # Store in EST
+        }
 
         transformed_data.append(transformed_record)
 
     return transformed_data
 
-def load_data(transformed_data, session: Session):
-    """
-    Loads transformed data into the RentalSummary table.
-    """
-    for record in transformed_data:
-        # Check if the rental_id already exists in the summary table
-        existing_record = session.query(RentalSummary).filter(RentalSummary.rental_id == record.rental_id).first()
-        if existing_record:
-            # Update the existing record
-            existing_record.user_name = record.user_name
-            existing_record.user_location = record.user_location
-            existing_record.vehicle_details = record.vehicle_details
-            existing_record.rental_duration = record.rental_duration
-            existing_record.total_cost = record.total_cost
-            existing_record.rental_status = record.rental_status
-            existing_record.rental_category = record.rental_category
-            existing_record.last_updated = record.last_updated
+def transform_frame(rows, last_updated=None):
+    """
+    Vectorized equivalent of transform_data: loads a chunk of extracted rows into a
+    DataFrame and derives the summary columns with column operations (Arrow-backed
+    strings) instead of a Python loop. Returns a DataFrame with SUMMARY_COLUMNS.
+    """
+    # Imported here so the web app and the row engine do not load pandas
+    import numpy as np
+    import pandas as pd
+
+    if last_updated is None:
+        last_updated = datetime.now(utc).astimezone(est)
+    if not rows:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    frame = pd.DataFrame.from_records(rows, columns=list(rows[0]._fields))
+
+    # Missing values render as "None", like the f-strings in transform_data
+    def text(column):
+        return frame[column].fillna("None").astype("string[pyarrow]")
+
+    summary = pd.DataFrame({
+        "rental_id": frame["rental_id"],
+        "user_name": text("first_name") + " " + text("last_name"),
+        "user_location": text("city") + ", " + text("state"),
+        "vehicle_details": text("make") + " " + text("model") + " - " + text("type"),
+        "rental_duration": (frame["return_date"] - frame["pickup_date"]).dt.days.clip(lower=1),  # At least 1 day
+        "total_cost": frame["total_cost"],
+        "rental_status": frame["rental_status"],
+        "rental_category": np.where(text("type").str.lower() == "suv", "Luxury", "Economy"),
+    })
+    summary["last_updated"] = last_updated  # Store in EST
+    return summary
+
+def load_data(transformed_data, session: Session, batch_size=ETL_BATCH_SIZE):
+    """
+    Loads transformed data into the RentalSummary table. The caller commits.
+
+    Records are written in batches with one INSERT ... ON CONFLICT (rental_id)
+    DO UPDATE statement per batch. The statement is compiled once and executed
+    with each batch as parameters, which the driver sends as a multi-row insert.
+    Returns a (rows_inserted, rows_updated) tuple.
+    """
+    inserted = updated = 0
+    update_columns = [column for column in SUMMARY_COLUMNS if column != "rental_id"]
+
+    stmt = insert_for_dialect(session, RentalSummary.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RentalSummary.rental_id],
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+
+    for start in range(0, len(transformed_data), batch_size):
+        batch = transformed_data[start:start + batch_size]
+        rental_ids = [record["rental_id"] for record in batch]
+
+        # Count the rows the upsert will update, so inserts and updates can be reported separately
+        existing = session.query(func.count(RentalSummary.summary_id)).filter(
+            RentalSummary.rental_id.in_(rental_ids)
+        ).scalar()
+
+        session.execute(stmt, batch, execution_options={"insertmanyvalues_page_size": batch_size})
+
+        updated += existing
+        inserted += len(batch) - existing
+
+    return inserted, updated
+
+def load_frame(summary, session: Session, batch_size=ETL_BATCH_SIZE):
+    """
+    Bulk-writes a DataFrame from transform_frame. The caller commits.
+
+    On PostgreSQL the frame is streamed with COPY into a temporary staging table and
+    merged with a single INSERT ... SELECT ... ON CONFLICT, so no per-row Python objects
+    are built. Other databases fall back to the batched upserts of load_data.
+    Returns a (rows_inserted, rows_updated) tuple.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return load_data(summary.to_dict("records"), session, batch_size=batch_size)
+    if summary.empty:
+        return 0, 0
+
+    connection = session.connection()
+    # timestamptz so the EST stamp is converted exactly as the parameter-bound path converts it
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS rental_summary_stage ("
+        "rental_id integer, user_name varchar, user_location varchar, vehicle_details varchar, "
+        "rental_duration integer, total_cost numeric, rental_status varchar, rental_category varchar, "
+        "last_updated timestamptz) ON COMMIT DELETE ROWS"
+    )
+    connection.exec_driver_sql("TRUNCATE rental_summary_stage")
+
+    buffer = io.StringIO()
+    summary[SUMMARY_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY rental_summary_stage ({', '.join(SUMMARY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+    existing = connection.exec_driver_sql(
+        "SELECT count(*) FROM rental_summary JOIN rental_summary_stage USING (rental_id)"
+    ).scalar()
+    update_columns = [column for column in SUMMARY_COLUMNS if column != "rental_id"]
+    connection.exec_driver_sql(
+        f"INSERT INTO rental_summary ({', '.join(SUMMARY_COLUMNS)}) "
+        f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM rental_summary_stage "
+        f"ON CONFLICT (rental_id) DO UPDATE SET "
+        + ", ".join(f"{column} = EXCLUDED.{column}" for column in update_columns)
+    )
+    return len(summary) - existing, existing
+
+class EtlChunkError(Exception):
+    """
+    Raised when a chunk of a partition fails; the message names the rental_id range that failed.
+    """
+
+def count_rentals(session: Session, since=None, until=None, start_key=None, end_key=None):
+    """
+    Returns the number of rentals in the run window and key range, used to report progress.
+    """
+    query = session.query(func.count(Rental.rental_id))
+    if since is not None:
+        query = query.filter(Rental.updated_at > since)
+    if until is not None:
+        query = query.filter(Rental.updated_at <= until)
+    if start_key is not None:
+        query = query.filter(Rental.rental_id >= start_key)
+    if end_key is not None:
+        query = query.filter(Rental.rental_id <= end_key)
+    return query.scalar()
+
+def partition_ranges(session: Session, since=None, until=None, partitions=1):
+    """
+    Splits the rental_id key space of the run window into contiguous, non-overlapping ranges.
+    Returns a list of (start_key, end_key) tuples; a single partition covers everything.
+    """
+    if partitions <= 1:
+        return [(None, None)]
+
+    query = session.query(func.min(Rental.rental_id), func.max(Rental.rental_id))
+    if since is not None:
+        query = query.filter(Rental.updated_at > since)
+    if until is not None:
+        query = query.filter(Rental.updated_at <= until)
+    low, high = query.one()
+    if low is None:
+        return []
+
+    step = -(-(high - low + 1) // partitions)  # Ceiling division
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+def process_partition(checkpoint_id, since, until, start_key, end_key, last_updated, chunk_size=ETL_CHUNK_SIZE, batch_size=ETL_BATCH_SIZE, transform_engine=ETL_TRANSFORM_ENGINE, on_chunk=None):
+    """
+    Extracts, transforms and loads the rentals in one rental_id range.
+    Runs in the calling process for a serial run or in a worker process for a parallel one.
+
+    Each chunk is committed together with the partition's checkpoint (the last
+    rental_id loaded), so a failed run can be resumed from there. A failing chunk
+    is recorded on the checkpoint and raised as EtlChunkError naming its key range.
+    transform_engine selects transform_data/load_data ("python") or
+    transform_frame/load_frame ("pandas"). on_chunk, if given, is called with the number of rows of each committed chunk.
+    """
+    session = SessionLocal()
+    source_session = SessionLocal()  # Dedicated connection for the streaming extract
+    stats = {
+        "start_key": start_key, "end_key": end_key, "processed": 0, "inserted": 0, "updated": 0,
+        "extract_seconds": 0.0, "transform_seconds": 0.0, "load_seconds": 0.0
+    }
+    started = time.perf_counter()
+    checkpoint = session.query(EtlCheckpoint).filter(EtlCheckpoint.checkpoint_id == checkpoint_id)
+    committed_key = None
+    chunk_keys = None
+
+    try:
+        # Step 1: Extract
+        chunks = iter(extract_data(
+            source_session, since=since, until=until, chunk_size=chunk_size,
+            start_key=start_key, end_key=end_key
+        ))
+
+        while True:
+            stage_started = time.perf_counter()
+            rows = next(chunks, None)
+            stats["extract_seconds"] += time.perf_counter() - stage_started
+            if rows is None:
+                break
+            chunk_keys = (rows[0].rental_id, rows[-1].rental_id)
+
+            # Step 2: Transform
+            stage_started = time.perf_counter()
+            if transform_engine == "pandas":
+                transformed_data = transform_frame(rows, last_updated)
+            else:
+                transformed_data = transform_data(rows, last_updated)
+            stats["transform_seconds"] += time.perf_counter() - stage_started
+
+            # Step 3: Load, committing the chunk together with its checkpoint
+            stage_started = time.perf_counter()
+            if transform_engine == "pandas":
+                inserted, updated = load_frame(transformed_data, session, batch_size=batch_size)
+            else:
+                inserted, updated = load_data(transformed_data, session, batch_size=batch_size)
+            checkpoint.update({"checkpoint_key": chunk_keys[1]})
+            session.commit()
+            stats["load_seconds"] += time.perf_counter() - stage_started
+
+            committed_key, chunk_keys = chunk_keys[1], None
+            stats["processed"] += len(rows)
+            stats["inserted"] += inserted
+            stats["updated"] += updated
+            if on_chunk:
+                on_chunk(len(rows))
+        source_session.close()
+
+        checkpoint.update({"status": "done"})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        if chunk_keys is not None:
+            message = f"Chunk rental_id {chunk_keys[0]}-{chunk_keys[1]} failed: {e}"
         else:
-            # Insert new record
-            session.add(record)
+            resume_after = committed_key if committed_key is not None else start_key
+            message = f"Extract after rental_id {resume_after if resume_after is not None else 'start'} failed: {e}"
+        checkpoint.update({"status": "failed", "error": message})
+        session.commit()
+        raise EtlChunkError(message) from e
+    finally:
+        source_session.close()
+        session.close()
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def start_run(session: Session, mode, window_start=None, window_end=None, resumed_from=None):
+    """
+    Records the start of an ETL run and its change window in the run ledger and returns its run_id.
+    """
+    run = EtlRun(
+        mode=mode, status="running", started_at=datetime.utcnow(),
+        window_start=window_start, window_end=window_end, resumed_from=resumed_from
+    )
+    session.add(run)
+    session.commit()
+    return run.run_id
+
+def create_checkpoints(session: Session, run_id, ranges):
+    """
+    Records one checkpoint per partition of the run. Returns (checkpoint_id, start_key, end_key) tuples.
+    """
+    checkpoints = [EtlCheckpoint(run_id=run_id, start_key=start_key, end_key=end_key, status="pending") for start_key, end_key in ranges]
+    session.add_all(checkpoints)
+    session.commit()
+    return [(checkpoint.checkpoint_id, checkpoint.start_key, checkpoint.end_key) for checkpoint in checkpoints]
+
+def resumable_run(session: Session):
+    """
+    Returns the latest run if it failed or was interrupted (still marked running), otherwise None.
+    """
+    run = latest_run(session)
+    if run is None or run.status not in ("failed", "running"):
+        return None
+    return run
+
+def remaining_ranges(session: Session, run_id):
+    """
+    Returns the rental_id ranges a run had not committed yet, starting after each partition's checkpoint.
+    Returns None if the run never recorded its partitions.
+    """
+    checkpoints = session.query(EtlCheckpoint).filter(EtlCheckpoint.run_id == run_id).order_by(EtlCheckpoint.checkpoint_id).all()
+    if not checkpoints:
+        return None
+    ranges = []
+    for checkpoint in checkpoints:
+        if checkpoint.status == "done":
+            continue
+        if checkpoint.checkpoint_key is None:
+            ranges.append((checkpoint.start_key, checkpoint.end_key))
+        elif checkpoint.end_key is None or checkpoint.checkpoint_key < checkpoint.end_key:
+            ranges.append((checkpoint.checkpoint_key + 1, checkpoint.end_key))
+    return ranges
 
+def finish_run(session: Session, run_id, stats, rows_total=0):
+    """
+    Records the outcome, row counts and per-stage durations of an ETL run in the run ledger.
+    """
+    run = session.get(EtlRun, run_id)
+    run.status = "failed" if stats["error"] else "succeeded"
+    run.finished_at = datetime.utcnow()
+    run.rows_extracted = stats["processed"]
+    run.rows_inserted = stats["inserted"]
+    run.rows_updated = stats["updated"]
+    run.rows_skipped = max(rows_total - stats["processed"], 0)  # Rentals without a matching user or vehicle
+    run.rows_total = rows_total
+    run.extract_seconds = sum(partition["extract_seconds"] for partition in stats["partitions"])
+    run.transform_seconds = sum(partition["transform_seconds"] for partition in stats["partitions"])
+    run.load_seconds = sum(partition["load_seconds"] for partition in stats["partitions"])
+    run.error = stats["error"]
+    if not stats["error"]:
+        # Counted once per run so status pages never have to scan rental_summary
+        run.summary_rows = session.query(func.count(RentalSummary.summary_id)).scalar()
     session.commit()
 
-def run_etl():
+def latest_run(session: Session, status=None):
+    """
+    Returns the most recent ETL run from the ledger (optionally with the given status), or None.
+    """
+    query = session.query(EtlRun)
+    if status is not None:
+        query = query.filter(EtlRun.status == status)
+    return query.order_by(EtlRun.run_id.desc()).first()
+
+def recent_runs(session: Session, limit=10):
+    """
+    Returns the latest ETL runs from the ledger, newest first.
+    """
+    return session.query(EtlRun).order_by(EtlRun.run_id.desc()).limit(limit).all()
+
+def run_etl(full_refresh=False, chunk_size=ETL_CHUNK_SIZE, batch_size=ETL_BATCH_SIZE, workers=ETL_WORKERS, partitions=None, progress=None, resume=False, transform_engine=ETL_TRANSFORM_ENGINE):
     """
     Runs the ETL process to populate the RentalSummary table.
+
+    By default only rentals added or changed since the last successful run are
+    processed (incremental mode). Pass full_refresh=True to rebuild the summary
+    from every rental.
+
+    With workers > 1 the rental_id key space is split into partitions (one per
+    worker unless given) that are transformed and loaded by a process pool, each
+    worker using its own connections. Every record of a run carries the same
+    last_updated stamp, so the result is the same as a serial run.
+
+    Chunks are committed as they are loaded and each partition records a
+    checkpoint. With resume=True, if the latest run failed or was interrupted,
+    its change window is reused and only the rentals after each checkpoint are
+    processed; otherwise a normal run starts.
+
+    transform_engine="pandas" transforms each chunk with vectorized DataFrame
+    operations and bulk-writes it (COPY on PostgreSQL) instead of building
+    records row by row.
+
+    progress, if given, is called as progress(rows_processed, rows_total) as
+    chunks (serial) or partitions (parallel) complete.
+
+    Only one run proceeds at a time across every process (EtlLock); while another
+    holds the lock this returns at once with coalesced set and records nothing:
+    the trigger is covered by the run in progress.
+
+    Every run is recorded in the etl_runs ledger, with its progress (rows_extracted
+    of rows_total) updated as chunks commit. Returns a dict with the run_id,
+    the number of rentals processed, summary rows inserted and updated,
+    per-partition timings, and the error message if the run failed.
     """
+    stats = {"run_id": None, "processed": 0, "inserted": 0, "updated": 0, "partitions": [], "error": None, "coalesced": False}
+    lock = EtlLock()
+    if not lock.acquire():
+        stats["coalesced"] = True
+        print("Another ETL run is in progress; this trigger is merged into it.")
+        return stats
+
     session = SessionLocal()
+    done = 0
+    total = 0
+
+    def report(rows):
+        nonlocal done
+        done += rows
+        # In the ledger, so the status pages of every web worker see it
+        session.query(EtlRun).filter(EtlRun.run_id == stats["run_id"]).update({"rows_extracted": done, "rows_total": total})
+        session.commit()
+        if progress:
+            progress(done, total)
 
     try:
-        # Step 1: Extract
-        rentals = extract_data(session)
+        previous = resumable_run(session) if resume else None
+        if previous is not None:
+            # Continue the failed run's window from its checkpoints
+            mode, since, until = previous.mode, previous.window_start, previous.window_end
+            ranges = remaining_ranges(session, previous.run_id)
+            if ranges is None:
+                # It failed before recording its partitions, so none of its window was covered
+                ranges = partition_ranges(session, since, until if mode == "incremental" else None, partitions or workers)
+            if previous.status == "running":
+                previous.status = "failed"
+                previous.error = "Interrupted before completion"
+            stats["run_id"] = start_run(session, mode, since, until, resumed_from=previous.run_id)
+            print(f"Resuming ETL run {previous.run_id} ({len(ranges)} partitions left).")
+        else:
+            if resume:
+                print("No failed ETL run to resume; starting a new run.")
+
+            # Fix the upper bound of this run so rentals changed while it runs are picked up next time
+            since = None if full_refresh else get_watermark(session)
+            until = session.query(func.max(Rental.updated_at)).scalar()
+            mode = "full" if since is None else "incremental"
+            if since is not None:
+                # Re-read the overlap for late commits (re-running rentals is harmless, summaries are keyed by rental_id)
+                since -= timedelta(seconds=ETL_WATERMARK_OVERLAP)
+            stats["run_id"] = start_run(session, mode, since, until)
+
+            if since is not None and (until is None or count_rentals(session, since, until) == 0):
+                print("No new or changed rentals since the last ETL run.")
+                finish_run(session, stats["run_id"], stats)
+                return stats
+
+            # A full rebuild takes every rental, including ones without a timestamp
+            ranges = partition_ranges(session, since, until if mode == "incremental" else None, partitions or workers)
 
-        # Step 2: Transform
-        transformed_data = transform_data(rentals, session)
+        window_until = until if mode == "incremental" else None
+        checkpoints = create_checkpoints(session, stats["run_id"], ranges)
+        total = sum(count_rentals(session, since, window_until, start_key, end_key) for start_key, end_key in ranges)
+        report(0)
+        last_updated = datetime.now(utc).astimezone(est)
+        session.close()
+
+        # SQLite allows a single writer, so parallel workers would only lock each other out
+        if workers > 1 and engine.dialect.name == "sqlite":
+            print("SQLite does not support concurrent writers; running partitions serially.")
+            workers = 1
+
+        # Steps 1-3: Extract, transform and load each partition
+        results = []
+        errors = []
+        if workers > 1 and len(checkpoints) > 1:
+            # spawn, not fork: run_etl usually runs on a job thread of a threaded web worker, and a
+            # forked child would copy locks held by the other threads (and the parent's pooled connections)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [
+                    pool.submit(process_partition, checkpoint_id, since, window_until, start_key, end_key, last_updated, chunk_size, batch_size, transform_engine)
+                    for checkpoint_id, start_key, end_key in checkpoints
+                ]
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except EtlChunkError as e:
+                        errors.append(str(e))
+                        continue
+                    results.append(result)
+                    report(result["processed"])
+        else:
+            for checkpoint_id, start_key, end_key in checkpoints:
+                try:
+                    results.append(process_partition(
+                        checkpoint_id, since, window_until, start_key, end_key, last_updated, chunk_size, batch_size, transform_engine, on_chunk=report
+                    ))
+                except EtlChunkError as e:
+                    errors.append(str(e))
 
-        # Step 3: Load
-        load_data(transformed_data, session)
+        results.sort(key=lambda result: result["start_key"] or 0)
+        for result in results:
+            stats["processed"] += result["processed"]
+            stats["inserted"] += result["inserted"]
+            stats["updated"] += result["updated"]
+            stats["partitions"].append(result)
 
-        print("ETL process completed successfully!")
+        if errors:
+            # Leave the watermark alone; committed chunks are kept and --resume continues after them
+            stats["error"] = "; ".join(errors)
+            finish_run(session, stats["run_id"], stats, rows_total=total)
+            print("The ETL process failed; run with --resume to continue from the last checkpoint.")
+            for error in errors:
+                print(f"  {error}")
+            return stats
+
+        # Step 4: Advance the watermark once every partition has committed
+        # (re-running a window is harmless, summaries are keyed by rental_id)
+        if until is not None:
+            set_watermark(session, until)
+            session.commit()
+
+        finish_run(session, stats["run_id"], stats, rows_total=total)
+        print(
+            f"ETL process completed successfully! ({mode} run, {stats['processed']} rentals processed, "
+            f"{stats['inserted']} inserted, {stats['updated']} updated)"
+        )
+        if len(results) > 1:
+            for result in results:
+                print(
+                    f"  rental_id {result['start_key']}-{result['end_key']}: "
+                    f"{result['processed']} rentals in {result['seconds']:.2f}s"
+                )
     except Exception as e:
+        session.rollback()
+        stats["error"] = str(e)
         print(f"An error occurred during the ETL process: {e}")
+        if stats["run_id"] is not None:
+            finish_run(session, stats["run_id"], stats, rows_total=total)
     
     finally:
         session.close()
+        lock.release()
+
+    return stats
 
 if __name__ == "__main__":
-    run_etl()
+    parser = argparse.ArgumentParser(description="Populate the rental_summary table.")
+    parser.add_argument("--full", action="store_true", help="Rebuild summaries for every rental instead of only new or changed ones")
+    parser.add_argument("--batch-size", type=int, default=ETL_BATCH_SIZE, help="Summaries written per upsert statement")
+    parser.add_argument("--workers", type=int, default=ETL_WORKERS, help="Worker processes for a parallel run")
+    parser.add_argument("--partitions", type=int, default=None, help="rental_id ranges to split the run into (defaults to --workers)")
+    parser.add_argument("--resume", action="store_true", help="Continue the last failed run from its checkpoints")
+    parser.add_argument("--transform-engine", choices=["python", "pandas"], default=ETL_TRANSFORM_ENGINE, help="Row-by-row or vectorized transform")
+    args = parser.parse_args()
+    run_etl(
+        full_refresh=args.full, batch_size=args.batch_size, workers=args.workers,
+        partitions=args.partitions, resume=args.resume, transform_engine=args.transform_engine
+    )
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from database import Vehicle
+from snapshots import SnapshotServer, fetch_array
+
+EARTH_RADIUS_KM = 6371.0088
+# Seconds between checks for added, removed or moved vehicles
+GEO_INDEX_TTL = float(os.getenv("GEO_INDEX_TTL", "30"))
+# Vehicles per nearby search, and the most a request may ask for
+NEARBY_PAGE_SIZE = int(os.getenv("NEARBY_PAGE_SIZE", "20"))
+NEARBY_MAX_PAGE_SIZE = 100
+
+
+def unit_vectors(latitudes, longitudes):
+    """
+    Maps degrees of latitude/longitude onto points of the unit sphere, where straight-line
+    (chord) distance grows monotonically with great-circle distance.
+    """
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack((
+        np.cos(latitudes) * np.cos(longitudes),
+        np.cos(latitudes) * np.sin(longitudes),
+        np.sin(latitudes),
+    ))
+
+
+def fleet_fingerprint(session: Session):
+    """
+    Summarizes the located fleet in one aggregate query; it changes when a vehicle
+    with coordinates is added, removed or moved.
+    """
+    count, max_id, latitude_sum, longitude_sum = session.execute(
+        select(
+            func.count(), func.max(Vehicle.vehicle_id),
+            func.sum(Vehicle.location_latitude), func.sum(Vehicle.location_longitude)
+        ).where(Vehicle.location_latitude.isnot(None), Vehicle.location_longitude.isnot(None))
+    ).one()
+    return count, max_id, round(latitude_sum or 0.0, 6), round(longitude_sum or 0.0, 6)
+
+
+class GeoIndex:
+    """
+    Immutable in-memory KD-tree over the vehicles' coordinates (as unit vectors, so
+    distances are exact great-circle distances, with no distortion near the poles or
+    the antimeridian). Vehicles without coordinates are left out. version is the
+    fleet_fingerprint it was built from.
+    """
+
+    def __init__(self, vehicle_ids, latitudes, longitudes, version=None):
+        # Imported here so scipy loads with the first nearby search, not with the app
+        from scipy.spatial import cKDTree
+        self.vehicle_ids = np.asarray(vehicle_ids, dtype=np.int64)
+        self.tree = cKDTree(unit_vectors(latitudes, longitudes)) if len(self.vehicle_ids) else None
+        self.version = version
+
+    @classmethod
+    def load(cls, session: Session):
+        version = fleet_fingerprint(session)
+        columns = fetch_array(
+            session,
+            "SELECT vehicle_id, location_latitude, location_longitude FROM vehicles "
+            "WHERE location_latitude IS NOT NULL AND location_longitude IS NOT NULL",
+            3
+        )
+        return cls(columns[:, 0], columns[:, 1], columns[:, 2], version)
+
+    def nearest(self, latitude, longitude, k=NEARBY_PAGE_SIZE, radius_km=None):
+        """
+        Returns up to k (vehicle_id, distance_km) pairs closest to the point, nearest
+        first; with radius_km, only vehicles at most that far away.
+        """
+        if self.tree is None or k < 1:
+            return []
+        k = min(k, len(self.vehicle_ids))
+        bound = np.inf
+        if radius_km is not None:
+            # Chord length of the arc; a tiny margin keeps vehicles exactly on the radius
+            bound = 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2) * (1 + 1e-12)
+
+        chords, positions = self.tree.query(unit_vectors([latitude], [longitude])[0], k=k, distance_upper_bound=bound)
+        chords, positions = np.atleast_1d(chords), np.atleast_1d(positions)
+        found = np.isfinite(chords)  # Misses beyond the radius come back as inf
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords[found] / 2, 1.0))
+        return list(zip(self.vehicle_ids[positions[found]].tolist(), distances.tolist()))
+
+
+class GeoServer(SnapshotServer):
+    """
+    Holds the current GeoIndex for the process. At most every GEO_INDEX_TTL seconds a
+    request compares the fleet's fingerprint with the snapshot's and, if the fleet
+    changed, rebuilds the tree while other threads keep searching the old one.
+    """
+
+    def __init__(self, ttl=GEO_INDEX_TTL):
+        super().__init__(ttl)
+
+    def version(self, session: Session):
+        return fleet_fingerprint(session)
+
+    def load(self, session: Session):
+        return GeoIndex.load(session)
+
+    def nearest(self, latitude, longitude, k=NEARBY_PAGE_SIZE, radius_km=None):
+        return self.current().nearest(latitude, longitude, k, radius_km)
+
+
+# Shared geo index for the process (Flask app)
+geo_server = GeoServer()
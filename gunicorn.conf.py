@@ -0,0 +1,50 @@
+"""
+gunicorn settings for serving wsgi:app in production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process has its own connection pool, so the database sees up to
+WEB_CONCURRENCY x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections. Keep GUNICORN_THREADS
+at or below DB_POOL_SIZE.
+
+Graceful restarts: `kill -HUP <master>` replaces the workers once their in-flight
+requests finish. Because the app is preloaded, deploying new code needs a new
+master instead: `kill -USR2 <master>` starts one next to the old one, then
+`kill -TERM <old master>` retires it.
+"""
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Worker processes, each serving GUNICORN_THREADS requests at a time
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import the app (and load the recommendation index) once in the master; workers share it copy-on-write
+preload_app = True
+
+# Seconds a silent worker lives before it is killed, and that workers get to finish requests on restart
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Replace each worker after this many requests (jittered so they don't all restart together)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+
+
+def post_fork(server, worker):
+    # Connections the master opened while preloading would otherwise be shared with every
+    # worker. Start the worker with an empty pool and leave those sockets to the master
+    from database import engine
+    engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Stop the worker's password hashing processes along with it
+    from auth import password_hasher
+    password_hasher.shutdown()
@@ -0,0 +1,167 @@
+"""
+Load test of the production server: requests per second on /rent_vehicle as the
+number of gunicorn workers grows.
+
+For each worker count, starts `gunicorn -c gunicorn.conf.py wsgi:app` against
+DATABASE_URL, logs in as a load-test user (created if missing), then has
+--concurrency client threads request /rent_vehicle back to back for --duration
+seconds, optionally while --login-clients threads log in back to back (password
+hashing is deliberately CPU-heavy). Reports requests per second, latency
+percentiles and errors for each route. Run the clients on another machine (or
+give this one spare cores) so they are not what saturates first.
+
+    python load_test.py
+    python load_test.py --workers 1 4 8 --threads 1 --concurrency 32 --duration 30
+    python load_test.py --workers 4 --login-clients 8
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+import statistics
+import requests
+
+parser = argparse.ArgumentParser(description="Measure /rent_vehicle throughput at several gunicorn worker counts.")
+parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="Worker counts to test")
+parser.add_argument("--threads", type=int, default=None, help="Threads per worker (defaults to GUNICORN_THREADS)")
+parser.add_argument("--concurrency", type=int, default=16, help="Client threads sending requests")
+parser.add_argument("--login-clients", type=int, default=0, help="Client threads logging in alongside")
+parser.add_argument("--duration", type=float, default=20, help="Seconds of load per worker count")
+parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+parser.add_argument("--port", type=int, default=8765)
+args = parser.parse_args()
+
+LOAD_TEST_USERNAME = "load_test_user"
+LOAD_TEST_PASSWORD = "load-test-password"
+
+
+def ensure_user():
+    """
+    Creates the load-test user if it does not exist yet.
+    """
+    from database import SessionLocal, User
+    session = SessionLocal()
+    try:
+        if session.query(User).filter_by(username=LOAD_TEST_USERNAME).first() is None:
+            user = User(
+                first_name="Load", last_name="Test", username=LOAD_TEST_USERNAME,
+                email="load_test_user@example.com", phone_number="0000000000",
+                city="Seattle", state="WA", age=30, license_number="LOAD-TEST-0001"
+            )
+            user.set_password(LOAD_TEST_PASSWORD)
+            session.add(user)
+            session.commit()
+    finally:
+        session.close()
+
+
+def start_server(workers):
+    """
+    Starts gunicorn with the given number of workers and waits until it answers.
+    """
+    command = [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+        "--workers", str(workers), "--bind", f"127.0.0.1:{args.port}", "--access-logfile", os.devnull,
+    ]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    server = subprocess.Popen(command + ["wsgi:app"], cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/login", timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def login():
+    """
+    Logs in once and returns the session cookies; every client thread reuses them.
+    """
+    client = requests.Session()
+    response = client.post(
+        f"http://127.0.0.1:{args.port}/login",
+        data={"username": LOAD_TEST_USERNAME, "password": LOAD_TEST_PASSWORD}, allow_redirects=False
+    )
+    if "session" not in client.cookies:
+        raise RuntimeError(f"Login failed (status {response.status_code})")
+    return client.cookies
+
+
+def run_load(cookies, seconds):
+    """
+    Requests /rent_vehicle from args.concurrency threads, and logs in from
+    args.login_clients threads, for seconds. Returns {"rent_vehicle": ..., "login": ...},
+    each (latencies of successful requests, number of failed requests).
+    """
+    base = f"http://127.0.0.1:{args.port}"
+    stop_at = time.monotonic() + seconds
+    results = {"rent_vehicle": ([], []), "login": ([], [])}
+
+    def client(name, send):
+        http = requests.Session()
+        http.cookies.update(cookies)
+        mine, failed = [], 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                ok = send(http).status_code in (200, 302)
+            except requests.RequestException:
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        latencies, failures = results[name]
+        latencies.extend(mine)
+        failures.append(failed)
+
+    rent = lambda http: http.get(f"{base}/rent_vehicle", allow_redirects=False, timeout=30)
+    log_in = lambda http: http.post(
+        f"{base}/login", data={"username": LOAD_TEST_USERNAME, "password": LOAD_TEST_PASSWORD}, allow_redirects=False, timeout=30
+    )
+    threads = [threading.Thread(target=client, args=("rent_vehicle", rent)) for _ in range(args.concurrency)]
+    threads += [threading.Thread(target=client, args=("login", log_in)) for _ in range(args.login_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {name: (latencies, sum(failures)) for name, (latencies, failures) in results.items()}
+
+
+def report(workers, name, latencies, errors):
+    latencies.sort()
+    percentile = lambda p: 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+    print(
+        f"{workers:>7} {name:<13} {len(latencies) / args.duration:>8.1f} {1000 * statistics.median(latencies) if latencies else 0.0:>8.1f} "
+        f"{percentile(0.95):>8.1f} {percentile(0.99):>8.1f} {errors:>7}"
+    )
+
+
+def main():
+    ensure_user()
+    print(f"{'workers':>7} {'route':<13} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers in args.workers:
+        server = start_server(workers)
+        try:
+            cookies = login()
+            run_load(cookies, args.warmup)
+            results = run_load(cookies, args.duration)
+        finally:
+            # SIGTERM: gunicorn's graceful shutdown
+            server.terminate()
+            server.wait()
+
+        report(workers, "/rent_vehicle", *results["rent_vehicle"])
+        if args.login_clients:
+            report(workers, "/login", *results["login"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import random
+from collections import defaultdict
 from datetime import datetime, timedelta
 from sqlalchemy.orm import sessionmaker
 from database import engine, User, Vehicle, Rental
@@ -14,6 +15,9 @@ vehicles = session.query(Vehicle).all()
 # Generate random rental records
 rental_status_options = ["Completed", "Ongoing", "Cancelled"]
 
+# Ongoing rentals hold their vehicle, and overlapping ones are rejected (see availability.py)
+ongoing_periods = defaultdict(list)
+
 # Each user gets 5–10 rentals on average
 for user in users:
     num_rentals = random.randint(5, 10)  # 5–10 rentals per user
@@ -28,6 +32,14 @@ for user in users:
         total_days = (return_date - pickup_date).days
         total_cost = total_days * float(vehicle.daily_rate)
 
+        # Settle any generated double booking as a completed rental
+        rental_status = random.choice(rental_status_options)
+        if rental_status == "Ongoing":
+            if any(pickup_date <= end and start <= return_date for start, end in ongoing_periods[vehicle.vehicle_id]):
+                rental_status = "Completed"
+            else:
+                ongoing_periods[vehicle.vehicle_id].append((pickup_date, return_date))
+
         rental = Rental(
             user_id=user.user_id,
             vehicle_id=vehicle.vehicle_id,
@@ -36,7 +48,7 @@ for user in users:
             pickup_location=vehicle.location_city,
             return_location=vehicle.location_city,
             total_cost=total_cost,
-            rental_status=random.choice(rental_status_options),
+            rental_status=rental_status,
             created_at=datetime.utcnow()
         )
         session.add(rental)
@@ -0,0 +1,205 @@
+import os
+import numpy as np
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import Rental, EtlWatermark, UserRecommendation, PopularVehicles
+from recommendation_system import rank_neighbors, location_key, RECOMMENDATION_VERSION_JOB, CANCELLED_STATUS
+from snapshots import SnapshotServer, fetch_array, LOAD_BATCH_SIZE
+
+# Neighbors kept per vehicle; a user's top N only ever needs each rented vehicle's first N
+RECOMMENDATION_INDEX_NEIGHBORS = int(os.getenv("RECOMMENDATION_INDEX_NEIGHBORS", "50"))
+# Seconds between checks for a newer recommendation run
+RECOMMENDATION_INDEX_TTL = float(os.getenv("RECOMMENDATION_INDEX_TTL", "30"))
+# Vehicles cached per user in user_recommendations
+USER_RECOMMENDATIONS = int(os.getenv("USER_RECOMMENDATIONS", "5"))
+
+
+def published_version(session: Session):
+    """
+    Returns the stamp of the last recommendation run that changed vehicle_recommendations.
+    """
+    watermark = session.get(EtlWatermark, RECOMMENDATION_VERSION_JOB)
+    return watermark.high_water_mark if watermark else None
+
+
+class RecommendationIndex:
+    """
+    Immutable in-memory snapshot of each vehicle's best neighbors, in CSR form:
+    the neighbors of vehicle_ids[i] are neighbor_ids[offsets[i]:offsets[i + 1]],
+    best score first, with matching scores.
+
+    Memory is 16 bytes per vehicle plus 8 bytes per stored neighbor; with the
+    default 50 neighbors that is about 4.2 MB per 10k vehicles (memory_bytes()
+    reports the exact figure).
+
+    It also holds the cold-start lists from popular_vehicles, keyed by location_key().
+    """
+
+    def __init__(self, vehicle_ids, offsets, neighbor_ids, scores, version=None, popular=None):
+        self.vehicle_ids = vehicle_ids  # sorted, int64
+        self.offsets = offsets  # int64, len(vehicle_ids) + 1
+        self.neighbor_ids = neighbor_ids  # int32
+        self.scores = scores  # float32
+        self.version = version
+        self.popular = popular or {}
+
+    @classmethod
+    def load(cls, session: Session, max_neighbors=RECOMMENDATION_INDEX_NEIGHBORS):
+        """
+        Builds a snapshot from vehicle_recommendations, reading the pairs in blocks and
+        keeping each vehicle's max_neighbors best neighbors from either side of a pair.
+        """
+        # Read the version first: if a run publishes mid-load, the next check reloads again
+        version = published_version(session)
+        popular = {(row.location_state, row.location_city): row.vehicle_ids for row in session.query(PopularVehicles)}
+
+        pairs = fetch_array(session, "SELECT vehicle_id_1, vehicle_id_2, recommendation_score FROM vehicle_recommendations", 3)
+        if not len(pairs):
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, np.zeros(1, dtype=np.int64), empty.astype(np.int32), empty.astype(np.float32), version, popular)
+
+        vehicle_ids_1, vehicle_ids_2 = pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64)
+        scores = np.nan_to_num(pairs[:, 2])  # NULL scores count as 0
+        sources, neighbor_ids, positions = rank_neighbors(vehicle_ids_1, vehicle_ids_2, scores, max_neighbors)
+
+        vehicle_ids, counts = np.unique(sources, return_counts=True)
+        offsets = np.zeros(len(vehicle_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(vehicle_ids, offsets, neighbor_ids.astype(np.int32), scores[positions].astype(np.float32), version, popular)
+
+    def neighbors(self, vehicle_id):
+        """
+        Returns (neighbor_ids, scores) arrays for one vehicle, best first; empty if it has none.
+        """
+        position = np.searchsorted(self.vehicle_ids, vehicle_id)
+        if position == len(self.vehicle_ids) or self.vehicle_ids[position] != vehicle_id:
+            return self.neighbor_ids[:0], self.scores[:0]
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.neighbor_ids[start:end], self.scores[start:end]
+
+    def recommend(self, rented_vehicle_ids, n=5):
+        """
+        Returns up to n vehicle ids for a user who rented rented_vehicle_ids, ranked by their
+        best score with any rented vehicle (ties to the lower id). Only the first n neighbors
+        of each rented vehicle can make the cut, so this reads at most n entries per vehicle.
+        """
+        best = {}
+        for vehicle_id in rented_vehicle_ids:
+            neighbor_ids, scores = self.neighbors(vehicle_id)
+            for neighbor_id, score in zip(neighbor_ids[:n].tolist(), scores[:n].tolist()):
+                if score > best.get(neighbor_id, float("-inf")):
+                    best[neighbor_id] = score
+        return sorted(best, key=lambda neighbor_id: (-best[neighbor_id], neighbor_id))[:n]
+
+    def popular_vehicles(self, state=None, city=None, n=5):
+        """
+        Returns up to n of the most rented vehicles in the city, falling back to the
+        state and then the whole fleet when the location has no vehicles.
+        """
+        state, city = location_key(state, city)
+        for key in ((state, city), (state, ""), ("", "")):
+            if self.popular.get(key):
+                return self.popular[key][:n]
+        return []
+
+    def memory_bytes(self):
+        return self.vehicle_ids.nbytes + self.offsets.nbytes + self.neighbor_ids.nbytes + self.scores.nbytes
+
+
+class RecommendationServer(SnapshotServer):
+    """
+    Holds the current RecommendationIndex for the process and hot-swaps it.
+
+    At most every RECOMMENDATION_INDEX_TTL seconds a request checks whether a
+    recommendation run has published since the snapshot was built; if so, that
+    request builds the new snapshot while other threads keep serving the old
+    one, then the reference is swapped.
+    """
+
+    def __init__(self, ttl=RECOMMENDATION_INDEX_TTL):
+        super().__init__(ttl)
+
+    def version(self, session: Session):
+        return published_version(session)
+
+    def load(self, session: Session):
+        return RecommendationIndex.load(session)
+
+    def recommend(self, rented_vehicle_ids, n=5):
+        return self.current().recommend(rented_vehicle_ids, n)
+
+
+# Shared serving index for the process (Flask app)
+recommendation_server = RecommendationServer()
+
+
+def fill_user_recommendations(session: Session, index, vehicle_ids=None, n=USER_RECOMMENDATIONS, batch_size=LOAD_BATCH_SIZE):
+    """
+    Recomputes renters' top n from index and replaces their user_recommendations rows:
+    every renter, or given vehicle_ids, only users who rented one of those vehicles.
+    Readers see the old or the new rows, never a mix. Users who rent while this runs
+    have their row dropped, so they are filled on their next page load.
+    Returns the number of users cached. The caller commits.
+    """
+    started = datetime.utcnow()
+    table = UserRecommendation.__table__
+    # Cancelled rentals are not history to recommend from, as in the pair counts
+    rentals = select(Rental.user_id, Rental.vehicle_id).where(Rental.rental_status != CANCELLED_STATUS).distinct()
+    stale = table.delete()
+    if vehicle_ids is not None:
+        # Including cancelled rentals, so whoever cancelled is refreshed too
+        users = select(Rental.user_id).where(Rental.vehicle_id.in_(vehicle_ids))
+        rentals = rentals.where(Rental.user_id.in_(users))
+        stale = stale.where(table.c.user_id.in_(users))
+
+    rented_vehicle_ids = defaultdict(set)
+    for user_id, vehicle_id in session.execute(rentals):
+        rented_vehicle_ids[user_id].add(vehicle_id)
+
+    session.execute(stale)
+    rows = [
+        {"user_id": user_id, "vehicle_ids": index.recommend(rented, n), "computed_at": started}
+        for user_id, rented in rented_vehicle_ids.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        session.execute(table.insert(), rows[start:start + batch_size])
+
+    session.execute(table.delete().where(
+        table.c.user_id.in_(select(Rental.user_id).where(Rental.updated_at >= started))
+    ))
+    return len(rows)
+
+
+def user_recommendations(session: Session, user_id, n=USER_RECOMMENDATIONS, state=None, city=None):
+    """
+    Returns the user's recommended vehicle ids, best first, with one primary key lookup
+    on the cache. On a miss they are ranked from the serving index and stored for the
+    next request. Users with nothing to recommend from (no rentals yet) get the most
+    rented vehicles near their registered state/city, from memory.
+    """
+    cached = session.get(UserRecommendation, user_id)
+    if cached is not None:
+        return cached.vehicle_ids[:n] or recommendation_server.current().popular_vehicles(state, city, n)
+
+    rented_vehicle_ids = {
+        vehicle_id for (vehicle_id,) in session.query(Rental.vehicle_id).filter(
+            Rental.user_id == user_id, Rental.rental_status != CANCELLED_STATUS
+        ).distinct()
+    }
+    vehicle_ids = recommendation_server.recommend(rented_vehicle_ids, n)
+    try:
+        session.add(UserRecommendation(user_id=user_id, vehicle_ids=vehicle_ids, computed_at=datetime.utcnow()))
+        session.commit()
+    except IntegrityError:
+        session.rollback()  # Filled by a concurrent request or batch
+    return vehicle_ids or recommendation_server.current().popular_vehicles(state, city, n)
+
+
+def invalidate_user_recommendations(session: Session, user_id):
+    """
+    Drops the user's cached recommendations. Call it in the transaction that changes their rentals.
+    """
+    session.query(UserRecommendation).filter(UserRecommendation.user_id == user_id).delete(synchronize_session=False)
@@ -1,45 +1,140 @@
+import io
+import os
+import pickle
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from sqlalchemy import func, bindparam, select, insert
 from sqlalchemy.orm import Session
-from database import SessionLocal, Rental, Vehicle, VehicleRecommendations
+from database import (
+    SessionLocal, Rental, Vehicle, VehicleRecommendations, PopularVehicles, RecommendationRental, RentalDeletion,
+    insert_for_dialect
+)
+from etl_process import get_watermark, set_watermark
 from collections import defaultdict
+from itertools import groupby
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+# "mapreduce" counts pairs with per-user Python loops, "sparse" with a sparse matrix product,
+# "parallel" runs the MapReduce over a process pool
+RECOMMENDATION_ENGINE = os.getenv("RECOMMENDATION_ENGINE", "mapreduce")
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", "4"))
+# Keep only each vehicle's K best neighbors, stored in both directions (unset or 0 keeps every pair once)
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "0")) or None
+# Distinct pairs a mapper's combiner holds before spilling them to disk (roughly 150 bytes each)
+RECOMMENDATION_SPILL_PAIRS = int(os.getenv("RECOMMENDATION_SPILL_PAIRS", "1000000"))
+# Where shuffle and spill files go; defaults to the system temp directory
+RECOMMENDATION_SPILL_DIR = os.getenv("RECOMMENDATION_SPILL_DIR") or None
+# Most rented vehicles kept per city, state and fleet-wide for users with no rental history
+RECOMMENDATION_POPULAR_VEHICLES = int(os.getenv("RECOMMENDATION_POPULAR_VEHICLES", "20"))
+RECOMMENDATION_BATCH_SIZE = int(os.getenv("RECOMMENDATION_BATCH_SIZE", "5000"))
+# Rows fetched per round trip by the streaming extract
+RECOMMENDATION_CHUNK_SIZE = int(os.getenv("RECOMMENDATION_CHUNK_SIZE", "10000"))
+RUN_BLOCK_SIZE = 10000
+# Runs a reducer merges at once (one block of each is held in memory); more are merged in passes
+RUN_MERGE_FAN_IN = 64
+RECOMMENDATION_JOB_NAME = "recommendations"
+# Stamped in the same transaction as every change to vehicle_recommendations; serving indexes reload when it moves
+RECOMMENDATION_VERSION_JOB = "recommendations_published"
+CANCELLED_STATUS = "Cancelled"
 
-def extract_rental_data(session: Session):
+
+def extract_rental_data(session: Session, chunk_size=RECOMMENDATION_CHUNK_SIZE, partition=0, partitions=1):
+    """
+    Extract the rentals to count, as recorded by record_counted_rentals (cancelled
+    rentals are not counted). Only user_id and vehicle_id are selected, ordered by
+    user, and rows are streamed from a server-side cursor chunk_size at a time.
+    With partitions > 1, only the users with user_id % partitions == partition are read.
+    """
+    query = select(RecommendationRental.user_id, RecommendationRental.vehicle_id).order_by(RecommendationRental.user_id)
+    if partitions > 1:
+        query = query.where(RecommendationRental.user_id % partitions == partition)
+    result = session.execute(query, execution_options={"yield_per": chunk_size})
+    for chunk in result.partitions():
+        yield from chunk
+
+
+def user_vehicle_lists(rentals):
     """
-    Extract rental data from the database.
+    Yields (user_id, vehicle_ids) for each user in rentals ordered by user, one user at a time.
     """
-    rentals = session.query(Rental).all()
-    return rentals
+    for user_id, user_rentals in groupby(rentals, key=attrgetter("user_id")):
+        yield user_id, [rental.vehicle_id for rental in user_rentals]
 
 
 def map_phase(rentals):
     """
     Map phase: Generate (vehicle_id_1, vehicle_id_2) pairs from rentals.
+    Rentals must be ordered by user, as extract_rental_data returns them.
     """
     vehicle_pairs = defaultdict(int)
 
-    # Group rentals by user
-    user_rentals = defaultdict(list)
-    for rental in rentals:
-        user_rentals[rental.user_id].append(rental.vehicle_id)
-
     # Generate vehicle pairs for each user's rentals
-    for vehicle_list in user_rentals.values():
-        vehicle_list = list(set(vehicle_list))  # Remove duplicate rentals
+    for _, vehicle_list in user_vehicle_lists(rentals):
+        vehicle_list = sorted(set(vehicle_list))  # Remove duplicate rentals; pairs come out sorted
         for i in range(len(vehicle_list)):
             for j in range(i + 1, len(vehicle_list)):
-                pair = tuple(sorted((vehicle_list[i], vehicle_list[j])))
-                vehicle_pairs[pair] += 1
+                vehicle_pairs[(vehicle_list[i], vehicle_list[j])] += 1
 
     return vehicle_pairs
 
 
+def cooccurrence_counts(user_ids, vehicle_ids):
+    """
+    Counts co-rented vehicle pairs from parallel user_id / vehicle_id sequences
+    with one sparse matrix product.
+
+    Builds a binary user x vehicle incidence matrix X (repeat rentals of the same
+    vehicle by a user count once, like map_phase); X^T X then holds, for each pair
+    of vehicles, the number of users that rented both. Returns parallel
+    (vehicle_id_1, vehicle_id_2, co_rent_count) arrays with vehicle_id_1 < vehicle_id_2.
+    """
+    # Imported here so the web app, which only ranks from stored pairs, does not load scipy
+    from scipy import sparse
+
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    vehicle_ids = np.asarray(vehicle_ids, dtype=np.int64)
+    if len(user_ids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # Map database ids onto dense row/column positions; vehicles stays sorted,
+    # so row < col in the upper triangle means vehicle_id_1 < vehicle_id_2
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    vehicles, vehicle_index = np.unique(vehicle_ids, return_inverse=True)
+
+    incidence = sparse.csr_matrix(
+        (np.ones(len(user_index), dtype=np.int32), (user_index, vehicle_index)),
+        shape=(len(users), len(vehicles)),
+    )
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+
+    co_rents = sparse.triu(incidence.T @ incidence, k=1).tocoo()
+    return vehicles[co_rents.row], vehicles[co_rents.col], co_rents.data
+
+
+def cooccurrence_phase(user_ids, vehicle_ids):
+    """
+    Sparse alternative to map_phase: returns the same
+    {(vehicle_id_1, vehicle_id_2): co_rent_count} mapping, computed by cooccurrence_counts.
+    """
+    vehicle_ids_1, vehicle_ids_2, co_rent_counts = cooccurrence_counts(user_ids, vehicle_ids)
+    pairs = zip(vehicle_ids_1.tolist(), vehicle_ids_2.tolist())
+    return dict(zip(pairs, co_rent_counts.tolist()))
+
+
 def reduce_phase(vehicle_pairs):
     """
     Reduce phase: Consolidate and calculate recommendation scores.
+    vehicle_pairs is a {pair: co_rent_count} dict or an iterable of (pair, co_rent_count) items.
     """
     recommendations = []
-    for (vehicle_id_1, vehicle_id_2), co_rent_count in vehicle_pairs.items():
+    pair_counts = vehicle_pairs.items() if isinstance(vehicle_pairs, dict) else vehicle_pairs
+    for (vehicle_id_1, vehicle_id_2), co_rent_count in pair_counts:
         recommendations.append({
             'vehicle_id_1': vehicle_id_1,
             'vehicle_id_2': vehicle_id_2,
@@ -49,60 +144,602 @@ def reduce_phase(vehicle_pairs):
     return recommendations
 
 
-def load_recommendations(recommendations, session: Session):
+def rank_neighbors(vehicle_ids_1, vehicle_ids_2, scores, k):
+    """
+    Ranks every pair from both sides. Returns (vehicle_ids, neighbor_ids, pair_positions)
+    arrays grouped by vehicle, best score first (ties to the lower neighbor id), with at
+    most k neighbors per vehicle; pair_positions index the input arrays. A pair stored
+    in both directions (a top-K table) is kept once per side.
+    """
+    sources = np.concatenate([vehicle_ids_1, vehicle_ids_2])
+    neighbors = np.concatenate([vehicle_ids_2, vehicle_ids_1])
+    positions = np.tile(np.arange(len(vehicle_ids_1)), 2)
+    scores = np.tile(scores, 2)
+
+    order = np.lexsort((neighbors, -scores, sources))
+    sources, neighbors, positions = sources[order], neighbors[order], positions[order]
+    distinct = np.r_[True, (sources[1:] != sources[:-1]) | (neighbors[1:] != neighbors[:-1])]
+    sources, neighbors, positions = sources[distinct], neighbors[distinct], positions[distinct]
+
+    # Rank within each vehicle's group
+    group_starts = np.r_[0, np.flatnonzero(np.diff(sources)) + 1]
+    ranks = np.arange(len(sources)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(sources)]))
+    keep = ranks < k
+    return sources[keep], neighbors[keep], positions[keep]
+
+
+def top_k_neighbors(recommendations, k):
+    """
+    Keeps, for every vehicle, only its k highest-scoring neighbors. Each pair is
+    considered from both sides, so a row has vehicle_id_1 = the vehicle and
+    vehicle_id_2 = its neighbor, and a pair appears twice if each vehicle is in the
+    other's top k. Ties go to the lower neighbor id. Returns at most k rows per vehicle.
+    """
+    if not recommendations:
+        return []
+
+    def column(name, dtype):
+        return np.fromiter((rec[name] for rec in recommendations), dtype=dtype, count=len(recommendations))
+
+    co_rent_counts, scores = column('co_rent_count', np.int64), column('recommendation_score', np.float64)
+    vehicle_ids, neighbor_ids, positions = rank_neighbors(
+        column('vehicle_id_1', np.int64), column('vehicle_id_2', np.int64), scores, k
+    )
+
+    return [
+        {
+            'vehicle_id_1': vehicle_id,
+            'vehicle_id_2': neighbor_id,
+            'co_rent_count': co_rent_count,
+            'recommendation_score': score
+        }
+        for vehicle_id, neighbor_id, co_rent_count, score in zip(
+            vehicle_ids.tolist(), neighbor_ids.tolist(), co_rent_counts[positions].tolist(), scores[positions].tolist()
+        )
+    ]
+
+
+def run_blocks(keys, counts):
+    """
+    Splits parallel key / count arrays into blocks of RUN_BLOCK_SIZE for write_run.
     """
-    Load recommendations into the VehicleRecommendations table.
+    for start in range(0, len(keys), RUN_BLOCK_SIZE):
+        yield keys[start:start + RUN_BLOCK_SIZE], counts[start:start + RUN_BLOCK_SIZE]
+
+
+def write_run(path, blocks):
     """
-    for rec in recommendations:
-        existing_rec = session.query(VehicleRecommendations).filter(
-            VehicleRecommendations.vehicle_id_1 == rec['vehicle_id_1'],
-            VehicleRecommendations.vehicle_id_2 == rec['vehicle_id_2']
-        ).first()
+    Writes (pair keys, counts) array blocks to disk so they can be streamed back.
+    """
+    with open(path, "wb") as f:
+        for block in blocks:
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(path):
+    """
+    Streams the (pair keys, counts) blocks of a run written by write_run.
+    """
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def merge_runs(paths):
+    """
+    Merges runs whose keys are sorted and distinct within each run, summing the counts
+    of equal keys. Yields (keys, counts) blocks in key order; one block of each run is
+    held at a time.
+    """
+    runs = [read_run(path) for path in paths]
+    current = [next(run, None) for run in runs]
+    while True:
+        live = [i for i, block in enumerate(current) if block is not None]
+        if not live:
+            return
+
+        # Keys up to the smallest last key of the current blocks cannot appear in any later block
+        bound = min(current[i][0][-1] for i in live)
+        keys, counts = [], []
+        for i in live:
+            block_keys, block_counts = current[i]
+            cut = np.searchsorted(block_keys, bound, side="right")
+            keys.append(block_keys[:cut])
+            counts.append(block_counts[:cut])
+            current[i] = (block_keys[cut:], block_counts[cut:]) if cut < len(block_keys) else next(runs[i], None)
+
+        keys, counts = np.concatenate(keys), np.concatenate(counts)
+        order = np.argsort(keys, kind="stable")
+        keys, counts = keys[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        yield keys[starts], np.add.reduceat(counts, starts)
+
+
+def map_partition(map_id, partitions, spill_dir, spill_pairs=RECOMMENDATION_SPILL_PAIRS):
+    """
+    Parallel map task for one hash partition of users (user_id % partitions == map_id),
+    streamed from the database by the worker itself.
+
+    A local combiner pre-aggregates the mapper's pair counts, keyed by
+    vehicle_id_1 << 32 | vehicle_id_2 so a spill can sort and store them as arrays; they
+    are then shuffled to the reducers as one run file per reducer partition, sorted by
+    key. The combiner is flushed to a new set of runs whenever it holds more than
+    spill_pairs distinct pairs, which bounds the mapper's memory. Returns
+    {reducer partition: [run file paths]}.
+    """
+    combined = defaultdict(int)
+    runs = defaultdict(list)
+
+    def spill():
+        # Partition by pair key so every count for a pair meets in the same reducer, in
+        # sorted runs the reducer can merge without a table of every pair
+        keys = np.fromiter(combined.keys(), dtype=np.int64, count=len(combined))
+        counts = np.fromiter(combined.values(), dtype=np.int64, count=len(combined))
+        combined.clear()
+        order = np.argsort(keys)
+        keys, counts = keys[order], counts[order]
+        reducers = keys % partitions
+        for reducer in range(partitions):
+            in_partition = reducers == reducer
+            if in_partition.any():
+                path = os.path.join(spill_dir, f"map{map_id}-reduce{reducer}-{len(runs[reducer])}.run")
+                write_run(path, run_blocks(keys[in_partition], counts[in_partition]))
+                runs[reducer].append(path)
+
+    session = SessionLocal()
+    try:
+        for _, vehicle_list in user_vehicle_lists(extract_rental_data(session, partition=map_id, partitions=partitions)):
+            vehicle_list = sorted(set(vehicle_list))  # Remove duplicate rentals; pairs come out sorted
+            for i in range(len(vehicle_list)):
+                high = vehicle_list[i] << 32
+                for j in range(i + 1, len(vehicle_list)):
+                    combined[high | vehicle_list[j]] += 1
+
+            if len(combined) > spill_pairs:
+                spill()
+    finally:
+        session.close()
+
+    spill()
+    return dict(runs)
+
+
+def reduce_partition(reducer, run_paths, spill_dir):
+    """
+    Parallel reduce task for one key partition: sums the counts for each pair across
+    the sorted runs from every mapper with a streaming merge, at most RUN_MERGE_FAN_IN
+    runs at a time (wider inputs are merged in passes through intermediate runs), so
+    memory does not grow with the number of pairs. Writes the partition's summed
+    counts to a run and returns its path.
+    """
+    merge_pass = 0
+    while len(run_paths) > RUN_MERGE_FAN_IN:
+        merged_paths = []
+        for start in range(0, len(run_paths), RUN_MERGE_FAN_IN):
+            path = os.path.join(spill_dir, f"reduce{reducer}-pass{merge_pass}-{len(merged_paths)}.run")
+            write_run(path, merge_runs(run_paths[start:start + RUN_MERGE_FAN_IN]))
+            merged_paths.append(path)
+        run_paths, merge_pass = merged_paths, merge_pass + 1
+
+    path = os.path.join(spill_dir, f"reduce{reducer}.run")
+    write_run(path, merge_runs(run_paths))
+    return path
+
+
+def parallel_map_reduce(workers=RECOMMENDATION_WORKERS, partitions=None, spill_pairs=RECOMMENDATION_SPILL_PAIRS):
+    """
+    Runs the map and reduce phases across a process pool and returns the recommendations.
+
+    Each map task streams one hash partition of users from the committed
+    recommendation_rentals snapshot, combines its pair counts and shuffles them to disk
+    by pair key; then one reduce task per key partition merges its runs. partitions
+    defaults to workers and is used for both the map and the reduce side. Neither the
+    parent nor a worker holds more than one partition's combiner or merge buffers;
+    only the final recommendations are returned to the parent.
+    """
+    partitions = partitions or workers
+
+    # spawn, not fork: mappers open their own connections rather than inheriting the parent's
+    with tempfile.TemporaryDirectory(prefix="recommendations-", dir=RECOMMENDATION_SPILL_DIR) as spill_dir, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Map: every mapper must finish before a reducer can see all runs for its key range
+        map_outputs = pool.map(
+            map_partition, range(partitions), [partitions] * partitions, [spill_dir] * partitions, [spill_pairs] * partitions
+        )
 
-        if existing_rec:
-            # Update existing record
-            existing_rec.co_rent_count = rec['co_rent_count']
-            existing_rec.recommendation_score = rec['recommendation_score']
-            existing_rec.last_updated = datetime.utcnow()
+        # Shuffle: collect each key partition's runs from every mapper
+        reducer_inputs = [[] for _ in range(partitions)]
+        for runs in map_outputs:
+            for reducer, paths in runs.items():
+                reducer_inputs[reducer].extend(paths)
+
+        # Reduce
+        recommendations = []
+        for path in pool.map(reduce_partition, range(partitions), reducer_inputs, [spill_dir] * partitions):
+            for keys, counts in read_run(path):
+                pairs = zip((keys >> 32).tolist(), (keys & 0xFFFFFFFF).tolist())
+                recommendations.extend(reduce_phase(zip(pairs, counts.tolist())))
+
+    return recommendations
+
+
+def pair_deltas(old_vehicles, new_vehicles):
+    """
+    Co-rent count changes for one user whose set of rented vehicles went from
+    old_vehicles to new_vehicles: +1 for each pair gained through an added vehicle,
+    -1 for each pair lost through a removed one. Pairs of unchanged vehicles are untouched.
+    """
+    deltas = defaultdict(int)
+    for vehicle_ids, changed, sign in ((new_vehicles, new_vehicles - old_vehicles, 1),
+                                       (old_vehicles, old_vehicles - new_vehicles, -1)):
+        for vehicle_id in changed:
+            for other_id in vehicle_ids:
+                # A pair of two changed vehicles is counted once, from its smaller id
+                if other_id == vehicle_id or (other_id in changed and other_id < vehicle_id):
+                    continue
+                deltas[(min(vehicle_id, other_id), max(vehicle_id, other_id))] += sign
+    return deltas
+
+
+def apply_pair_deltas(deltas, session: Session):
+    """
+    Applies co-rent count increments/decrements to vehicle_recommendations with an
+    upsert, then drops pairs whose count fell to zero. The caller commits.
+    """
+    deltas = {pair: delta for pair, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    table = VehicleRecommendations.__table__
+    stmt = insert_for_dialect(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.vehicle_id_1, table.c.vehicle_id_2],
+        set_={
+            "co_rent_count": table.c.co_rent_count + stmt.excluded.co_rent_count,
+            "recommendation_score": table.c.co_rent_count + stmt.excluded.co_rent_count,
+            "last_updated": stmt.excluded.last_updated,
+        }
+    )
+    now = datetime.utcnow()
+    session.execute(stmt, [
+        {"vehicle_id_1": vehicle_id_1, "vehicle_id_2": vehicle_id_2, "co_rent_count": delta,
+         "recommendation_score": delta, "last_updated": now}
+        for (vehicle_id_1, vehicle_id_2), delta in deltas.items()
+    ])
+
+    decremented = [{"v1": vehicle_id_1, "v2": vehicle_id_2} for (vehicle_id_1, vehicle_id_2), delta in deltas.items() if delta < 0]
+    if decremented:
+        session.execute(
+            table.delete().where(
+                table.c.vehicle_id_1 == bindparam("v1"), table.c.vehicle_id_2 == bindparam("v2"), table.c.co_rent_count <= 0
+            ),
+            decremented
+        )
+
+
+def record_counted_rentals(session: Session, last_deletion_id):
+    """
+    Before a full rebuild, replaces the snapshot of counted rentals with every rental that
+    is not cancelled (one INSERT ... SELECT) and clears the deletions it covers. The
+    rebuild then counts exactly this snapshot (extract_rental_data reads it), so the next
+    incremental run starts from exactly the counted state.
+
+    The watermark is cleared until the rebuild commits its counts, so an interrupted
+    rebuild is redone in full rather than continued incrementally. The caller commits.
+    """
+    session.query(RecommendationRental).delete(synchronize_session=False)
+    session.execute(insert(RecommendationRental).from_select(
+        ["rental_id", "user_id", "vehicle_id"],
+        select(Rental.rental_id, Rental.user_id, Rental.vehicle_id).where(Rental.rental_status != CANCELLED_STATUS)
+    ))
+    session.query(RentalDeletion).filter(RentalDeletion.deletion_id <= last_deletion_id).delete(synchronize_session=False)
+    set_watermark(session, None, job_name=RECOMMENDATION_JOB_NAME)
+
+
+def update_recommendations_incrementally(session: Session, since, until, last_deletion_id):
+    """
+    Applies the rentals changed in (since, until] and the rentals deleted up to
+    last_deletion_id to vehicle_recommendations as co-rent count increments and
+    decrements, without re-reading the rest of the rental history.
+
+    For each affected user, the vehicles counted last time (from the recommendation_rentals
+    snapshot) are compared with the vehicles they count now; only pairs involving a gained
+    or lost vehicle change. Work scales with the changed rentals and their users' histories.
+    Returns the number of affected users and the ids of the vehicles whose pair counts
+    changed. The caller commits.
+    """
+    # Step 1: Changed and deleted rentals
+    changed = session.query(Rental.rental_id, Rental.user_id, Rental.vehicle_id, Rental.rental_status).filter(
+        Rental.updated_at > since, Rental.updated_at <= until
+    ).all()
+    deleted_ids = [deletion.rental_id for deletion in session.query(RentalDeletion.rental_id).filter(
+        RentalDeletion.deletion_id <= last_deletion_id
+    )]
+    touched_ids = {rental.rental_id for rental in changed} | set(deleted_ids)
+    if not touched_ids:
+        return 0, set()
+
+    # Step 2: Users whose counted vehicles may change (a rental can move between users or vehicles)
+    previously_counted = session.query(RecommendationRental.user_id).filter(
+        RecommendationRental.rental_id.in_(touched_ids)
+    ).all()
+    affected_users = {rental.user_id for rental in changed} | {row.user_id for row in previously_counted}
+
+    # Step 3: Before and after state of the affected users
+    counted = {
+        row.rental_id: (row.user_id, row.vehicle_id)
+        for row in session.query(RecommendationRental).filter(RecommendationRental.user_id.in_(affected_users))
+    }
+    old_vehicles = defaultdict(set)
+    for user_id, vehicle_id in counted.values():
+        old_vehicles[user_id].add(vehicle_id)
+
+    for rental_id in deleted_ids:
+        counted.pop(rental_id, None)
+    for rental in changed:
+        if rental.rental_status == CANCELLED_STATUS:
+            counted.pop(rental.rental_id, None)
         else:
-            # Insert new record
-            new_rec = VehicleRecommendations(
-                vehicle_id_1=rec['vehicle_id_1'],
-                vehicle_id_2=rec['vehicle_id_2'],
-                co_rent_count=rec['co_rent_count'],
-                recommendation_score=rec['recommendation_score'],
-                last_updated=datetime.utcnow()
+            counted[rental.rental_id] = (rental.user_id, rental.vehicle_id)
+
+    new_vehicles = defaultdict(set)
+    for user_id, vehicle_id in counted.values():
+        new_vehicles[user_id].add(vehicle_id)
+
+    # Step 4: Apply the pair count changes
+    deltas = defaultdict(int)
+    for user_id in affected_users:
+        for pair, delta in pair_deltas(old_vehicles[user_id], new_vehicles[user_id]).items():
+            deltas[pair] += delta
+    apply_pair_deltas(deltas, session)
+
+    # Step 5: Update the snapshot of counted rentals and the watermark
+    session.query(RecommendationRental).filter(RecommendationRental.rental_id.in_(touched_ids)).delete(synchronize_session=False)
+    now_counted = [
+        {"rental_id": rental_id, "user_id": user_id, "vehicle_id": vehicle_id}
+        for rental_id, (user_id, vehicle_id) in counted.items() if rental_id in touched_ids
+    ]
+    if now_counted:
+        session.execute(RecommendationRental.__table__.insert(), now_counted)
+    session.query(RentalDeletion).filter(RentalDeletion.deletion_id <= last_deletion_id).delete(synchronize_session=False)
+    set_watermark(session, until, job_name=RECOMMENDATION_JOB_NAME)
+    changed_vehicle_ids = {vehicle_id for pair, delta in deltas.items() if delta for vehicle_id in pair}
+    return len(affected_users), changed_vehicle_ids
+
+
+def load_recommendations(recommendations, session: Session, batch_size=RECOMMENDATION_BATCH_SIZE):
+    """
+    Replaces the contents of the VehicleRecommendations table with recommendations
+    and commits, together with anything else pending in the session.
+
+    The whole replacement is one transaction, so readers keep seeing the previous
+    recommendation set until the commit and never a half-written one. On PostgreSQL
+    the rows are streamed with COPY into a temporary staging table and merged with
+    one INSERT ... ON CONFLICT plus one DELETE of pairs that are gone; unchanged
+    pairs are left as they are. Other databases delete the old set and insert the new one
+    in batches with a single compiled INSERT.
+    """
+    table = VehicleRecommendations.__table__
+    last_updated = datetime.utcnow()
+
+    if session.get_bind().dialect.name == "postgresql":
+        connection = session.connection()
+        connection.exec_driver_sql(
+            "CREATE TEMP TABLE IF NOT EXISTS vehicle_recommendations_stage ("
+            "vehicle_id_1 integer, vehicle_id_2 integer, co_rent_count integer, recommendation_score double precision"
+            ") ON COMMIT DELETE ROWS"
+        )
+        connection.exec_driver_sql("TRUNCATE vehicle_recommendations_stage")
+
+        buffer = io.StringIO()
+        buffer.writelines(
+            f"{rec['vehicle_id_1']},{rec['vehicle_id_2']},{rec['co_rent_count']},{rec['recommendation_score']}\n"
+            for rec in recommendations
+        )
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert("COPY vehicle_recommendations_stage FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        # Temporary tables are never auto-analyzed; give the planner row counts for the joins
+        connection.exec_driver_sql("ANALYZE vehicle_recommendations_stage")
+
+        connection.exec_driver_sql(
+            "DELETE FROM vehicle_recommendations AS r WHERE NOT EXISTS ("
+            "SELECT 1 FROM vehicle_recommendations_stage AS s "
+            "WHERE s.vehicle_id_1 = r.vehicle_id_1 AND s.vehicle_id_2 = r.vehicle_id_2)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO vehicle_recommendations (vehicle_id_1, vehicle_id_2, co_rent_count, recommendation_score, last_updated) "
+            "SELECT vehicle_id_1, vehicle_id_2, co_rent_count, recommendation_score, %(last_updated)s "
+            "FROM vehicle_recommendations_stage "
+            "ON CONFLICT (vehicle_id_1, vehicle_id_2) DO UPDATE SET "
+            "co_rent_count = EXCLUDED.co_rent_count, recommendation_score = EXCLUDED.recommendation_score, "
+            "last_updated = EXCLUDED.last_updated "
+            # Unchanged pairs are not rewritten
+            "WHERE (vehicle_recommendations.co_rent_count, vehicle_recommendations.recommendation_score) "
+            "IS DISTINCT FROM (EXCLUDED.co_rent_count, EXCLUDED.recommendation_score)",
+            {"last_updated": last_updated}
+        )
+    else:
+        session.execute(table.delete())
+        stmt = table.insert()
+        for start in range(0, len(recommendations), batch_size):
+            session.execute(
+                stmt,
+                [dict(rec, last_updated=last_updated) for rec in recommendations[start:start + batch_size]],
+                execution_options={"insertmanyvalues_page_size": batch_size}
             )
-            session.add(new_rec)
 
     session.commit()
 
 
-def run_recommendation_system():
+def location_key(state, city=None):
+    """
+    Returns the popular_vehicles key for a location: stripped and lowercased, '' when unknown.
+    """
+    return (state or "").strip().lower(), (city or "").strip().lower()
+
+
+def popular_vehicles(session: Session, n=RECOMMENDATION_POPULAR_VEHICLES):
+    """
+    Ranks vehicles by rental count (cancelled rentals excluded, ties to the lower id) and
+    returns the first n per city, per state (city '') and fleet-wide (state and city '').
+    """
+    rental_counts = (
+        session.query(Vehicle.vehicle_id, Vehicle.location_state, Vehicle.location_city, func.count(Rental.rental_id))
+        .outerjoin(Rental, (Rental.vehicle_id == Vehicle.vehicle_id) & (Rental.rental_status != CANCELLED_STATUS))
+        .group_by(Vehicle.vehicle_id, Vehicle.location_state, Vehicle.location_city)
+        .all()
+    )
+    rental_counts.sort(key=lambda row: (-row[3], row[0]))
+
+    ranked = defaultdict(list)
+    for vehicle_id, state, city, _ in rental_counts:
+        state, city = location_key(state, city)
+        for key in ((state, city), (state, ""), ("", "")):
+            if len(ranked[key]) < n:
+                ranked[key].append(vehicle_id)
+    return dict(ranked)
+
+
+def refresh_popular_vehicles(session: Session, n=RECOMMENDATION_POPULAR_VEHICLES):
     """
-    Run the recommendation system using MapReduce.
+    Recomputes the cold-start lists and replaces popular_vehicles if any list changed.
+    Returns True if it did. The caller commits.
     """
+    ranked = popular_vehicles(session, n)
+    stored = {
+        (row.location_state, row.location_city): row.vehicle_ids
+        for row in session.query(PopularVehicles)
+    }
+    if ranked == stored:
+        return False
+
+    computed_at = datetime.utcnow()
+    session.query(PopularVehicles).delete(synchronize_session=False)
+    if ranked:
+        session.execute(PopularVehicles.__table__.insert(), [
+            {"location_state": state, "location_city": city, "vehicle_ids": vehicle_ids, "computed_at": computed_at}
+            for (state, city), vehicle_ids in ranked.items()
+        ])
+    return True
+
+
+def refresh_user_recommendations(session: Session, vehicle_ids=None):
+    """
+    Refills the per-user recommendation cache from the recommendations just committed,
+    for every renter or, given vehicle_ids, only for users who rented one of them.
+    """
+    # Imported here because recommendation_index builds on this module
+    from recommendation_index import RecommendationIndex, fill_user_recommendations
+
+    users = fill_user_recommendations(session, RecommendationIndex.load(session), vehicle_ids=vehicle_ids)
+    session.commit()
+    print(f"Cached recommendations for {users} users.")
+
+
+def run_recommendation_system(full_refresh=False, engine=RECOMMENDATION_ENGINE, workers=RECOMMENDATION_WORKERS, partitions=None, top_k=RECOMMENDATION_TOP_K):
+    """
+    Run the recommendation system.
+
+    By default only rentals added, changed, cancelled or deleted since the last run are
+    applied, as co-rent count increments and decrements (incremental mode). The first
+    run, or full_refresh=True, rebuilds every pair from the whole rental history using
+    MapReduce (serial or across a process pool) or the sparse co-occurrence engine.
+
+    With top_k, each vehicle keeps only its top_k best neighbors, stored in both
+    directions, so the table grows linearly with the fleet. Counts outside the top k
+    are not kept, so top-K runs are always full rebuilds.
+    """
+    if engine not in ("mapreduce", "sparse", "parallel"):
+        raise ValueError(f"Unknown recommendation engine: {engine}")
+
     session = SessionLocal()
 
     try:
-        # Step 1: Extract data
-        rentals = extract_rental_data(session)
+        # Fix the bounds of this run so changes made while it runs are picked up next time
+        since = None if full_refresh or top_k else get_watermark(session, job_name=RECOMMENDATION_JOB_NAME)
+        until = session.query(func.max(Rental.updated_at)).scalar()
+        last_deletion_id = session.query(func.max(RentalDeletion.deletion_id)).scalar() or 0
 
-        # Step 2: Map phase
-        vehicle_pairs = map_phase(rentals)
+        if since is not None:
+            users, changed_vehicle_ids = update_recommendations_incrementally(session, since, until or since, last_deletion_id)
+            popular_changed = refresh_popular_vehicles(session)
+            if changed_vehicle_ids or popular_changed:
+                set_watermark(session, datetime.utcnow(), job_name=RECOMMENDATION_VERSION_JOB)
+            session.commit()
+            print(f"Recommendation system updated incrementally ({users} users with changed rentals).")
 
-        # Step 3: Reduce phase
-        recommendations = reduce_phase(vehicle_pairs)
+            # Only users of vehicles whose neighbor lists changed can see different recommendations
+            if changed_vehicle_ids:
+                refresh_user_recommendations(session, vehicle_ids=changed_vehicle_ids)
+            return
 
-        # Step 4: Load recommendations into the database
+        # Step 1: Record the rentals to count for the next incremental run, committed so
+        # the parallel engine's workers can read it, then stream them
+        record_counted_rentals(session, last_deletion_id)
+        session.commit()
+
+        if engine == "parallel":
+            # Steps 2 and 3: Map and reduce phases across the process pool
+            recommendations = parallel_map_reduce(workers=workers, partitions=partitions)
+        else:
+            rentals = extract_rental_data(session)
+
+            # Step 2: Map phase
+            if engine == "sparse":
+                user_ids, vehicle_ids = [], []
+                for rental in rentals:
+                    user_ids.append(rental.user_id)
+                    vehicle_ids.append(rental.vehicle_id)
+                vehicle_pairs = cooccurrence_phase(user_ids, vehicle_ids)
+            else:
+                vehicle_pairs = map_phase(rentals)
+
+            # Step 3: Reduce phase
+            recommendations = reduce_phase(vehicle_pairs)
+
+        if top_k:
+            recommendations = top_k_neighbors(recommendations, top_k)
+
+        # Step 4: Record the cold-start lists and the watermark for the next incremental run
+        # (a top-K table cannot be updated incrementally, so it keeps no watermark and no counted rentals)
+        if top_k:
+            session.query(RecommendationRental).delete(synchronize_session=False)
+        else:
+            set_watermark(session, until, job_name=RECOMMENDATION_JOB_NAME)
+        refresh_popular_vehicles(session)
+        set_watermark(session, datetime.utcnow(), job_name=RECOMMENDATION_VERSION_JOB)
+
+        # Step 5: Replace the recommendations in the database (commits the whole rebuild)
         load_recommendations(recommendations, session)
 
+        # Step 6: Refill the per-user recommendation cache
+        refresh_user_recommendations(session)
+
         print("Recommendation system updated successfully!")
     except Exception as e:
+        session.rollback()
         print(f"An error occurred during the recommendation process: {e}")
     finally:
         session.close()
 
 
 if __name__ == "__main__":
-    run_recommendation_system()
+    parser = argparse.ArgumentParser(description="Generate vehicle recommendations from rental history.")
+    parser.add_argument("--full", action="store_true", help="Rebuild every pair instead of applying only changed rentals")
+    parser.add_argument("--engine", choices=["mapreduce", "sparse", "parallel"], default=RECOMMENDATION_ENGINE,
+                        help="Pair counting engine for full rebuilds (default: RECOMMENDATION_ENGINE or mapreduce)")
+    parser.add_argument("--top-k", type=int, default=RECOMMENDATION_TOP_K, help="Keep only each vehicle's K best neighbors (always a full rebuild)")
+    parser.add_argument("--workers", type=int, default=RECOMMENDATION_WORKERS, help="Worker processes for the parallel engine")
+    parser.add_argument("--partitions", type=int, default=None, help="Map/reduce partitions for the parallel engine (defaults to --workers)")
+    args = parser.parse_args()
+
+    run_recommendation_system(
+        full_refresh=args.full, engine=args.engine, workers=args.workers, partitions=args.partitions, top_k=args.top_k
+    )
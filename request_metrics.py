@@ -0,0 +1,51 @@
+import os
+import threading
+from collections import deque
+
+# Latest requests per route group kept for the percentiles
+REQUEST_METRICS_WINDOW = int(os.getenv("REQUEST_METRICS_WINDOW", "1000"))
+
+
+class RouteLatency:
+    """
+    Request latencies of this process, per route group: count, average and maximum
+    since startup, and percentiles over the latest REQUEST_METRICS_WINDOW requests.
+    """
+
+    def __init__(self, window=REQUEST_METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def record(self, group, seconds):
+        with self._lock:
+            stats = self._groups.get(group)
+            if stats is None:
+                stats = self._groups[group] = {"count": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=self.window)}
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["recent"].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            groups = {group: dict(stats, recent=sorted(stats["recent"])) for group, stats in self._groups.items()}
+
+        def percentile(recent, p):
+            return round(1000 * recent[min(len(recent) - 1, int(p * len(recent)))], 3)
+
+        return {
+            group: {
+                "count": stats["count"],
+                "avg_ms": round(1000 * stats["total"] / stats["count"], 3),
+                "p50_ms": percentile(stats["recent"], 0.50),
+                "p95_ms": percentile(stats["recent"], 0.95),
+                "p99_ms": percentile(stats["recent"], 0.99),
+                "max_ms": round(1000 * stats["max"], 3),
+            }
+            for group, stats in groups.items()
+        }
+
+
+# Shared latency recorder for the process (Flask app)
+route_latency = RouteLatency()
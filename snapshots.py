@@ -0,0 +1,86 @@
+import time
+import threading
+import numpy as np
+from sqlalchemy.orm import Session
+from database import SessionLocal
+
+# Rows fetched per round trip when a snapshot is loaded
+LOAD_BATCH_SIZE = 50000
+
+
+def fetch_array(session: Session, sql, columns):
+    """
+    Runs sql and returns its rows as one float64 array with the given number of
+    columns (NULLs become NaN), fetched LOAD_BATCH_SIZE rows at a time. Raw DBAPI
+    rows go straight into arrays: building Row objects costs several times the fetch.
+    """
+    blocks = []
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            blocks.append(np.array(rows, dtype=np.float64))
+    finally:
+        cursor.close()
+    return np.concatenate(blocks) if blocks else np.empty((0, columns))
+
+
+class SnapshotServer:
+    """
+    Holds the current immutable in-memory snapshot for the process and hot-swaps it.
+
+    At most every ttl seconds a request compares the database's version with the
+    snapshot's and, if it moved, builds the new snapshot while other threads keep
+    serving the old one, then swaps the reference. Subclasses implement version()
+    and load(); snapshots carry the version they were built from as .version.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def version(self, session: Session):
+        raise NotImplementedError
+
+    def load(self, session: Session):
+        raise NotImplementedError
+
+    def current(self):
+        """
+        Returns the current snapshot, loading it on first use and refreshing it when stale.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.ttl:
+            return snapshot
+
+        # Only the first load waits; later refreshes run on one thread while the rest serve the old snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.ttl:
+                self._refresh()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """
+        Checks the version now and swaps in a new snapshot if it moved.
+        """
+        with self._lock:
+            self._refresh()
+        return self._snapshot
+
+    def _refresh(self):
+        session = SessionLocal()
+        try:
+            if self._snapshot is None or self.version(session) != self._snapshot.version:
+                self._snapshot = self.load(session)
+        finally:
+            session.close()
+        self._checked_at = time.monotonic()
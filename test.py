@@ -1,5 +1,28 @@
 from sqlalchemy.orm import sessionmaker
-from database import engine, SessionLocal, User, Vehicle, Rental, VehicleRecommendations
+from database import engine, SessionLocal, User, Vehicle, Rental, VehicleRecommendations, PopularVehicles
+from recommendation_system import location_key
+
+def print_popular_vehicles(session, user_id):
+    # Cold start: the most rented vehicles in the user's city, else state, else fleet-wide
+    user = session.get(User, user_id)
+    state, city = location_key(user.state, user.city) if user else ("", "")
+    for key in ((state, city), (state, ""), ("", "")):
+        popular = session.get(PopularVehicles, key)
+        if popular and popular.vehicle_ids:
+            break
+    else:
+        print("No popular vehicles computed yet; run recommendation_system.py")
+        return
+
+    vehicles = {
+        vehicle.vehicle_id: vehicle
+        for vehicle in session.query(Vehicle).filter(Vehicle.vehicle_id.in_(popular.vehicle_ids[:5]))
+    }
+    print(f"Popular vehicles for User ID: {user_id} ({', '.join(part for part in key if part) or 'all locations'})")
+    for vehicle_id in popular.vehicle_ids[:5]:
+        if vehicle_id in vehicles:
+            vehicle = vehicles[vehicle_id]
+            print(f"- {vehicle.make} {vehicle.model} ({vehicle.type}) - ${vehicle.daily_rate}/day")
 
 def get_user_recommendations(user_id):
     session = SessionLocal()
@@ -10,6 +33,7 @@ def get_user_recommendations(user_id):
 
         if not rented_vehicle_ids:
             print(f"No rental history found for user ID: {user_id}")
+            print_popular_vehicles(session, user_id)
             return
 
         # Fetch recommendations based on rented vehicles
@@ -19,6 +43,7 @@ def get_user_recommendations(user_id):
 
         if not recommendations:
             print(f"No recommendations found for user ID: {user_id}")
+            print_popular_vehicles(session, user_id)
             return
 
         # Fetch the recommended vehicle details
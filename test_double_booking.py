@@ -0,0 +1,105 @@
+import sys
+import threading
+from datetime import datetime, timedelta
+from database import SessionLocal, User, Vehicle, Rental
+from availability import book_vehicle, VehicleUnavailableError
+
+THREADS = 20
+
+def attempt_booking(user_id, vehicle_id, pickup_date, return_date, barrier, outcomes):
+    # Each thread books the same vehicle for overlapping dates through its own session
+    db = SessionLocal()
+    try:
+        rental = Rental(
+            user_id=user_id,
+            vehicle_id=vehicle_id,
+            pickup_date=pickup_date,
+            return_date=return_date,
+            pickup_location="Double booking test",
+            return_location="Double booking test",
+            total_cost=0,
+            rental_status="Ongoing"
+        )
+        barrier.wait()
+        book_vehicle(db, rental)
+        db.commit()
+        outcomes.append(("booked", rental.rental_id))
+    except VehicleUnavailableError:
+        outcomes.append(("unavailable", None))
+    except Exception as e:
+        outcomes.append(("error", e))
+    finally:
+        db.close()
+
+def book_concurrently(user_id, vehicle_id, pickup_date, threads=THREADS):
+    """
+    Books the vehicle from threads threads at once, each for a different window overlapping
+    the others. Returns (booked rental_ids, number unavailable, unexpected errors).
+    """
+    barrier = threading.Barrier(threads)
+    outcomes = []
+    workers = [
+        threading.Thread(
+            target=attempt_booking,
+            args=(user_id, vehicle_id, pickup_date + timedelta(days=i % 3), pickup_date + timedelta(days=3 + i % 3), barrier, outcomes)
+        )
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    booked = [rental_id for outcome, rental_id in outcomes if outcome == "booked"]
+    unavailable = sum(1 for outcome, _ in outcomes if outcome == "unavailable")
+    errors = [error for outcome, error in outcomes if outcome == "error"]
+    return booked, unavailable, errors
+
+def test_double_booking(database):
+    db = SessionLocal()
+    db.add(User(
+        first_name="Double", last_name="Booking", username="double_booking", password_hash="x", email="double_booking@example.com",
+        phone_number="0000000000", city="Seattle", state="WA", age=30, license_number="DOUBLE-BOOKING-0001"
+    ))
+    db.add(Vehicle(make="Toyota", model="Corolla", year=2020, type="car", daily_rate=50, location_city="Seattle", location_state="WA"))
+    db.commit()
+    db.close()
+
+    booked, unavailable, errors = book_concurrently(1, 1, datetime(2099, 1, 1), THREADS)
+
+    assert errors == []
+    assert len(booked) == 1
+    assert unavailable == THREADS - 1
+
+def check_double_booking(threads=THREADS):
+    """
+    Manual check against the database in DATABASE_URL; the test rentals are removed afterwards.
+    """
+    db = SessionLocal()
+    user = db.query(User).first()
+    vehicle = db.query(Vehicle).first()
+    db.close()
+    if user is None or vehicle is None:
+        print("Double booking check needs at least one user and one vehicle.")
+        return False
+
+    # Far-future dates no real rental uses
+    pickup_date = datetime(2099, 1, 1) + timedelta(days=datetime.utcnow().microsecond % 300)
+    booked, unavailable, errors = book_concurrently(user.user_id, vehicle.vehicle_id, pickup_date, threads)
+    print(f"Vehicle {vehicle.vehicle_id}, {threads} concurrent bookings: {len(booked)} booked, {unavailable} unavailable, {len(errors)} errors")
+    for error in errors:
+        print("Error:", error)
+
+    # Remove the test rentals (through the ORM, so recommendation runs see the deletions)
+    db = SessionLocal()
+    for rental in db.query(Rental).filter(Rental.rental_id.in_(booked)):
+        db.delete(rental)
+    db.commit()
+    db.close()
+
+    passed = len(booked) == 1 and not errors
+    print("Double booking check passed." if passed else "Double booking check FAILED.")
+    return passed
+
+if __name__ == "__main__":
+    sys.exit(0 if check_double_booking(int(sys.argv[1]) if len(sys.argv) > 1 else THREADS) else 1)
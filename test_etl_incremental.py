@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+from etl_process import run_etl, get_watermark
+from database import SessionLocal, User, Vehicle, Rental, RentalSummary
+
+
+def add_rental(db, updated_at=None):
+    rental = Rental(
+        user_id=1, vehicle_id=1, pickup_date=datetime(2024, 1, 1), return_date=datetime(2024, 1, 4),
+        pickup_location="Seattle", return_location="Seattle", total_cost=150, rental_status="Completed",
+        updated_at=updated_at
+    )
+    db.add(rental)
+    db.commit()
+    return rental.rental_id
+
+
+def test_incremental_run_picks_up_late_commit_below_watermark(database):
+    db = SessionLocal()
+    db.add(User(
+        first_name="Etl", last_name="Test", username="etl_test", password_hash="x", email="etl_test@example.com",
+        phone_number="0000000000", city="Seattle", state="WA", age=30, license_number="ETL-TEST-0001"
+    ))
+    db.add(Vehicle(make="Toyota", model="Corolla", year=2020, type="car", daily_rate=50, location_city="Seattle", location_state="WA"))
+    db.commit()
+    add_rental(db)
+    assert run_etl(full_refresh=True, workers=1)["error"] is None
+    watermark = get_watermark(db)
+
+    # Stamped before the watermark, as when a transaction flushed before the run read it but committed after
+    late_rental_id = add_rental(db, updated_at=watermark - timedelta(seconds=1))
+    stats = run_etl(workers=1)
+
+    assert stats["error"] is None
+    assert db.query(RentalSummary).filter(RentalSummary.rental_id == late_rental_id).count() == 1
+    db.close()
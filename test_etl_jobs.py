@@ -0,0 +1,40 @@
+from datetime import datetime
+from etl_process import run_etl, recent_runs, EtlLock
+from etl_jobs import EtlJobRunner
+from database import SessionLocal, EtlRun
+
+
+def test_run_blocked_by_another_process_is_coalesced(database):
+    other = EtlLock()
+    assert other.acquire()
+    try:
+        stats = run_etl(full_refresh=True, workers=1)
+    finally:
+        other.release()
+
+    assert stats["coalesced"] and stats["error"] is None
+    db = SessionLocal()
+    assert recent_runs(db) == []
+    db.close()
+
+
+def test_status_shows_a_run_started_by_another_process(database):
+    # As another web worker would leave it mid-run: holding the lock, with progress in the ledger
+    db = SessionLocal()
+    db.add(EtlRun(mode="full", status="running", started_at=datetime.utcnow(), rows_extracted=40, rows_total=100))
+    db.commit()
+    db.close()
+    runner = EtlJobRunner()
+
+    other = EtlLock()
+    assert other.acquire()
+    try:
+        job = runner.status()
+        assert (job["status"], job["rows_processed"], job["rows_total"]) == ("running", 40, 100)
+        assert runner.submit() is False
+    finally:
+        other.release()
+
+    # Once no process holds the lock, a row left running was interrupted
+    job = runner.status()
+    assert job["status"] == "failed" and job["error"] == "Interrupted before completion"
@@ -0,0 +1,90 @@
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import etl_process
+from etl_process import run_etl
+from database import SessionLocal, User, Vehicle, Rental, RentalSummary, EtlCheckpoint
+
+RENTALS = 10
+FAILING_RENTAL_ID = 7
+
+
+def seed_rentals():
+    db = SessionLocal()
+    db.add(User(
+        first_name="Etl", last_name="Test", username="etl_test", password_hash="x", email="etl_test@example.com",
+        phone_number="0000000000", city="Seattle", state="WA", age=30, license_number="ETL-TEST-0001"
+    ))
+    db.add(Vehicle(make="Toyota", model="Corolla", year=2020, type="car", daily_rate=50, location_city="Seattle", location_state="WA"))
+    db.commit()
+    for i in range(RENTALS):
+        pickup_date = datetime(2024, 1, 1) + timedelta(days=10 * i)
+        db.add(Rental(
+            user_id=1, vehicle_id=1, pickup_date=pickup_date, return_date=pickup_date + timedelta(days=3),
+            pickup_location="Seattle", return_location="Seattle", total_cost=150, rental_status="Completed"
+        ))
+    db.commit()
+    db.close()
+
+
+def summarized_rental_ids():
+    db = SessionLocal()
+    try:
+        return sorted(rental_id for rental_id, in db.query(RentalSummary.rental_id))
+    finally:
+        db.close()
+
+
+def test_failed_chunk_names_its_range_and_resumes(database, monkeypatch):
+    seed_rentals()
+
+    # The chunk holding FAILING_RENTAL_ID fails to load
+    load_data = etl_process.load_data
+    def failing_load_data(transformed_data, session, batch_size=etl_process.ETL_BATCH_SIZE):
+        if any(record["rental_id"] == FAILING_RENTAL_ID for record in transformed_data):
+            raise RuntimeError("disk full")
+        return load_data(transformed_data, session, batch_size=batch_size)
+    monkeypatch.setattr(etl_process, "load_data", failing_load_data)
+
+    stats = run_etl(full_refresh=True, chunk_size=2, workers=1, partitions=2)
+
+    match = re.fullmatch(r"Chunk rental_id (\d+)-(\d+) failed: disk full", stats["error"])
+    assert match, stats["error"]
+    first_key, last_key = int(match.group(1)), int(match.group(2))
+    assert first_key <= FAILING_RENTAL_ID <= last_key
+
+    # The other partition still ran, and the failing one kept the chunks before the failure
+    loaded = summarized_rental_ids()
+    assert FAILING_RENTAL_ID not in loaded
+    assert set(range(1, first_key)) <= set(loaded)
+    db = SessionLocal()
+    assert [checkpoint.error for checkpoint in db.query(EtlCheckpoint).filter(EtlCheckpoint.status == "failed")] == [stats["error"]]
+    db.close()
+
+    # Once the fault is gone, resuming loads only what is left
+    monkeypatch.setattr(etl_process, "load_data", load_data)
+    resumed = run_etl(resume=True, chunk_size=2, workers=1)
+
+    assert resumed["error"] is None
+    assert resumed["processed"] == RENTALS - len(loaded)
+    assert summarized_rental_ids() == list(range(1, RENTALS + 1))
+
+
+def test_resume_before_checkpoints_covers_the_whole_window(database, monkeypatch):
+    seed_rentals()
+
+    # The run stops after recording itself in the ledger but before recording its partitions
+    def failing_create_checkpoints(session, run_id, ranges):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(etl_process, "create_checkpoints", failing_create_checkpoints)
+    assert run_etl(full_refresh=True, chunk_size=2, workers=1, partitions=2)["error"] == "connection lost"
+    monkeypatch.undo()
+
+    resumed = run_etl(resume=True, chunk_size=2, workers=1, partitions=2)
+
+    assert resumed["error"] is None
+    assert resumed["processed"] == RENTALS
+    assert summarized_rental_ids() == list(range(1, RENTALS + 1))
+    db = SessionLocal()
+    assert etl_process.get_watermark(db) == db.query(func.max(Rental.updated_at)).scalar()
+    db.close()